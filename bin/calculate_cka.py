@@ -1,31 +1,41 @@
-import os
 from os.path import join
-import glob
 
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-from naturalcogsci.helpers import get_project_root
-from naturalcogsci.rsa_tools import cka
+from naturalcogsci.feature_store import feature_name, feature_path, find_features, open_features
+from naturalcogsci.helpers import get_project_root, str2bool
+from naturalcogsci.rsa_tools import CKATarget, cka_matrix
 
 
 def main(args):
 
     project_root = get_project_root()
     if args.features == "all":
-        feature_list = glob.glob(join(project_root, "data", "features", "*.npy"))
+        feature_list = find_features(join(project_root, "data", "features"))
     else:
-        feature_list = [join(project_root, "data", "features", f"{args.features}.npy")]
+        feature_list = [feature_path(join(project_root, "data", "features"), args.features)]
+    feature_names = [feature_name(feature) for feature in feature_list]
+
+    if args.allpairs:
+        cka_values = cka_matrix(feature_list, n_components=args.ncomponents, n_jobs=args.jobs)
+        df = pd.DataFrame(cka_values, index=feature_names, columns=feature_names)
+        df.to_csv(join(project_root, "data", "cka", "all_pairs.csv"))
+        return None
+
+    # the target and its statistics are loaded once for all features
+    target = CKATarget(
+        np.asarray(open_features(feature_path(join(project_root, "data", "features"), args.target))),
+        method=args.method,
+        batch_size=args.batchsize,
+    )
 
     df_feature_list = []
     df_cka_list = []
-    for feature in tqdm(feature_list):
-        cka_value = cka(
-            X=np.load(feature),
-            Y=np.load(join(project_root, "data", "features", f"{args.target}.npy")),
-        )
-        df_feature_list.append(feature.split(os.sep)[-1].split(".npy")[0])
+    for feature, name in tqdm(zip(feature_list, feature_names), total=len(feature_list)):
+        cka_value = target(open_features(feature))
+        df_feature_list.append(name)
         df_cka_list.append(cka_value)
 
     df = pd.DataFrame({"feature": df_feature_list, "cka": df_cka_list})
@@ -39,6 +49,11 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--features", "-f")
     parser.add_argument("--target", "-t")
+    parser.add_argument("--method", "-m", default="auto", choices=["auto", "feature", "gram", "minibatch"])
+    parser.add_argument("--batchsize", "-b", type=int, default=1024)
+    parser.add_argument("--allpairs", "-a", type=str2bool, default=False)
+    parser.add_argument("--ncomponents", "-n", type=int, default=None)
+    parser.add_argument("--jobs", "-j", type=int, default=1)
 
     args = parser.parse_args()
 
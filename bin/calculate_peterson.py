@@ -1,47 +1,27 @@
-from glob import glob
-import numpy as np
 import json
-import pickle
-from scipy.stats import spearmanr
-from sklearn.metrics.pairwise import cosine_similarity
-from tqdm import tqdm
-from os.path import basename
 
+from naturalcogsci.feature_store import find_features
 from naturalcogsci.helpers import get_project_root
+from naturalcogsci.peterson import load_peterson_benchmark
 
-PROJECT_ROOT = get_project_root()
 
-representations = glob(f"{PROJECT_ROOT}/data/peterson_features/*npy")
-a_file = open(f"{PROJECT_ROOT}/data/peterson/datasets_peterson.pkl", "rb")
-datasets = pickle.load(a_file)
-a_file.close()
+def main(args):
+    representations = find_features(f"{PROJECT_ROOT}/data/peterson_features")
+    benchmark = load_peterson_benchmark(PROJECT_ROOT)
 
+    json_dict = benchmark.score_files(representations, n_jobs=args.jobs)
 
-file_names = open(f"{PROJECT_ROOT}/data/peterson_features/file_names.txt", "r")
+    with open(f"{PROJECT_ROOT}/data/peterson/peterson_correlations.json", "w") as outfile:
+        json.dump(json_dict, outfile)
 
 
-# reading the file
-file_names = file_names.read().strip()
+if __name__ == "__main__":
+    import argparse
 
-# replacing end of line('/n') with ' ' and
-# splitting the text it further when '.' is seen.
-file_names = file_names.split("\n")
-file_names = [basename(x) for x in file_names]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", "-j", type=int, default=1)
 
-json_dict = {}
-for representation_name in tqdm(representations):
-    representation = np.load(representation_name)
-    corrs = []
-    for category in ["fruits", "vegetables", "animals"]:
-        indices = [file_names.index(img) for img in datasets[category]["fnames"]]
-        sim_matrix = cosine_similarity(representation[indices])
-        model_sim_vector = sim_matrix[np.tril_indices(sim_matrix.shape[0], -1)]
+    args = parser.parse_args()
 
-        human_sim_vector = datasets[category]["similarity"][np.tril_indices(datasets[category]["similarity"].shape[0], -1)]
-
-        corrs.append(spearmanr(human_sim_vector, model_sim_vector)[0])
-
-    json_dict[basename(representation_name).split(".npy")[0]] = np.mean(corrs)
-
-with open(f"{PROJECT_ROOT}/data/peterson/peterson_correlations.json", "w") as outfile:
-    json.dump(json_dict, outfile)
+    PROJECT_ROOT = get_project_root()
+    main(args)
@@ -12,6 +12,17 @@ if __name__ == "__main__":
 
     parser.add_argument("--featurename", "-f", nargs="+")
     parser.add_argument("--cached", "-c", type=str2bool)
+    parser.add_argument("--streaming", "-s", type=str2bool, default=False)
+    parser.add_argument("--batchsize", "-b", type=int, default=1)
+    parser.add_argument("--workers", "-w", type=int, default=0)
+    parser.add_argument("--format", choices=["npy", "chunked"], default="npy")
+    parser.add_argument("--dtype", default=None)
+    parser.add_argument("--contentcache", type=str2bool, default=False)
+    parser.add_argument("--modules", "-m", nargs="+", default=None)
+    parser.add_argument("--imagecache", type=int, default=None)
+    parser.add_argument("--pcasolver", type=str, default="full", choices=["full", "incremental", "randomized"])
+    parser.add_argument("--pcabatchsize", type=int, default=1024)
+    parser.add_argument("--textbatchsize", type=int, default=256)
 
     args = parser.parse_args()
 
@@ -26,4 +37,18 @@ if __name__ == "__main__":
     for feature in features:
         print(f"Extracting features for {feature}", flush=True)
         torch.cuda.empty_cache()
-        extract_features(feature, args.cached)
+        extract_features(
+            feature,
+            args.cached,
+            store_format=args.format,
+            storage_dtype=args.dtype,
+            streaming=args.streaming,
+            batch_size=args.batchsize,
+            num_workers=args.workers,
+            content_cache=args.contentcache,
+            module_names=args.modules,
+            image_cache_size=args.imagecache,
+            pca_solver=args.pcasolver,
+            pca_batch_size=args.pcabatchsize,
+            text_batch_size=args.textbatchsize,
+        )
@@ -1,54 +1,48 @@
 from os.path import join
 import os
-import glob
-
-import numpy as np
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-from tqdm import tqdm
-from skdim.id import TwoNN
 
+from naturalcogsci.feature_store import feature_name, find_features
 from naturalcogsci.helpers import get_project_root
+from naturalcogsci.intrinsic_dimensionality import intrinsic_dimension_table
 
-def id_calculator(data):
-    data = np.unique(data, axis=0)
-
-    scaler = MinMaxScaler()
-    data = scaler.fit_transform(data)
-
-    nn_method = TwoNN()
-    return nn_method.fit_transform(data)
 
-
-def main():
+def main(args):
     project_root = get_project_root()
 
-    feature_files = glob.glob(join(project_root, "data", "features", "*.npy"))
-
-    ed_scores = []
-
-    for feature_file in tqdm(feature_files):
-        features = np.load(feature_file)
-        feature_name = os.path.basename(feature_file).split(".npy")[0]
+    feature_files = find_features(join(project_root, "data", "features"))
+
+    # one file per feature, as the figures expect, and only the missing ones are estimated
+    feature_files = [
+        feature_file
+        for feature_file in feature_files
+        if not os.path.exists(
+            join(project_root, "data", "ID", f"{feature_name(feature_file)}.csv")
+        )
+    ]
+    if not feature_files:
+        print("All features already have a file in data/ID, skipping.")
+        return
+
+    df = intrinsic_dimension_table(
+        feature_files,
+        n_jobs=args.jobs,
+        n_projections=args.projections,
+        n_resamples=args.resamples,
+        resampling=args.resampling,
+    )
+    for i, name in enumerate(df["Feature"]):
+        df.iloc[[i]].to_csv(join(project_root, "data", "ID", f"{name}.csv"), index=False)
 
-        file_name = join(project_root, "data", "ID", f"{feature_name}.csv")
-
-
-
-        # Check if the file already exists
-        if not os.path.exists(file_name):
-            local_id = id_calculator(features)
-            ed_scores ={
-                    "Feature": feature_name,
-                    "local ID": [local_id],
-            }
-            df = pd.DataFrame(ed_scores)
-            df.to_csv(file_name, index=False)
 
+if __name__ == "__main__":
+    import argparse
 
-        else:
-            print(f"File {file_name} already exists, skipping.")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+    parser.add_argument("--projections", "-p", type=int, default=None)
+    parser.add_argument("--resamples", "-r", type=int, default=0)
+    parser.add_argument("--resampling", type=str, default="bootstrap", choices=["bootstrap", "subsample"])
 
+    args = parser.parse_args()
 
-if __name__ == "__main__":
-    main()
+    main(args)
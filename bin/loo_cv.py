@@ -0,0 +1,43 @@
+from os.path import join
+
+from naturalcogsci.helpers import get_project_root, str2bool
+from naturalcogsci.loo import loo_cv_files
+
+
+def main(args):
+    project_root = get_project_root()
+
+    paths, tasks = [], []
+    for task in args.experiments:
+        for feature in args.features:
+            feature = feature.replace("/", "_")
+            paths.append(
+                join(
+                    project_root,
+                    "data",
+                    "learner_behavioural",
+                    task,
+                    f"{feature}_{args.regularisation}_{args.transform}.csv",
+                )
+            )
+            tasks.append(task)
+
+    for path in loo_cv_files(paths, tasks, method=args.method, n_jobs=args.jobs, overwrite=args.overwrite):
+        print(path, flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--features", "-f", nargs="+")
+    parser.add_argument("--experiments", "-e", nargs="+", default=["reward_learning", "category_learning"])
+    parser.add_argument("--regularisation", "-r", default="l2")
+    parser.add_argument("--transform", "-t", default="original")
+    parser.add_argument("--method", "-m", default="exact", choices=["approximate", "exact"])
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+    parser.add_argument("--overwrite", type=str2bool, default=False)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -1,12 +1,4 @@
 #!/bin/bash
 
 embeddings=$(jq -c -r 'keys_unsorted[]' "$NATURALCOGSCI_ROOT"/data/model_plot_params.json)
-for experiment in reward_learning category_learning; do
-    for features in $embeddings; do
-        for transform in original; do
-            for regularisation in l2; do
-                    Rscript "$NATURALCOGSCI_ROOT"/bin/loo_cv.R "$features" $experiment $regularisation $transform
-                done
-            done
-        done
-    done
+uv run "$NATURALCOGSCI_ROOT"/bin/loo_cv.py -f $embeddings -e reward_learning category_learning -r l2 -t original -m exact -j -1
@@ -0,0 +1,44 @@
+from os.path import join
+import os
+
+from naturalcogsci.feature_store import feature_name, find_features
+from naturalcogsci.helpers import get_project_root
+from naturalcogsci.benchmarks import BENCHMARK_METRICS, BenchmarkRunner
+
+
+def main(args):
+    project_root = get_project_root()
+
+    if args.features == ["all"]:
+        feature_list = [feature_name(feature) for feature in find_features(join(project_root, "data", "features"))]
+    else:
+        feature_list = [feature.replace("/", "_") for feature in args.features]
+
+    runner = BenchmarkRunner(
+        project_root,
+        metrics=args.metrics,
+        cka_target=args.target,
+        n_projections=args.projections,
+        memory_limit=args.memorylimit,
+    )
+    df = runner.run(feature_list, n_jobs=args.jobs)
+
+    os.makedirs(join(project_root, "data", "benchmarks"), exist_ok=True)
+    df.to_csv(join(project_root, "data", "benchmarks", f"{args.name}.csv"), index=False)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--features", "-f", nargs="+", default=["all"])
+    parser.add_argument("--metrics", "-m", nargs="+", default=list(BENCHMARK_METRICS), choices=list(BENCHMARK_METRICS))
+    parser.add_argument("--target", "-t", default="task")
+    parser.add_argument("--projections", "-p", type=int, default=None)
+    parser.add_argument("--memorylimit", type=float, default=4e9)
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+    parser.add_argument("--name", "-n", default="benchmarks")
+
+    args = parser.parse_args()
+
+    main(args)
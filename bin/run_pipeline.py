@@ -0,0 +1,57 @@
+import json
+from os.path import join
+
+from naturalcogsci.helpers import get_project_root, str2bool
+from naturalcogsci.pipeline import PIPELINE_STAGES, build_pipeline
+
+
+def main(args):
+    project_root = get_project_root()
+
+    if args.features == ["all"]:
+        with open(join(project_root, "data", "model_plot_params.json")) as f:
+            features = list(json.load(f))
+    else:
+        features = args.features
+
+    pipeline = build_pipeline(
+        project_root,
+        features,
+        experiments=args.experiments,
+        stages=args.stages,
+        regularisation=args.regularisation,
+        transform=args.transform,
+        loo_method=args.loomethod,
+    )
+
+    if args.backend == "slurm":
+        node_sbatch_args = {
+            "extraction": ["--partition=gpu", "--mem-per-cpu=26000MB"],
+            "learners": ["--cpus-per-task=4", "--mem=64G"],
+        }
+        status = pipeline.submit_slurm(args.sbatch, node_sbatch_args, dry_run=args.dryrun)
+    else:
+        status = pipeline.run(n_jobs=args.jobs, dry_run=args.dryrun)
+
+    for name, node_status in status.items():
+        print(f"{name}: {node_status}", flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--features", "-f", nargs="+", default=["all"])
+    parser.add_argument("--experiments", "-e", nargs="+", default=["reward_learning", "category_learning"])
+    parser.add_argument("--stages", "-s", nargs="+", default=PIPELINE_STAGES, choices=PIPELINE_STAGES)
+    parser.add_argument("--regularisation", "-r", default="l2")
+    parser.add_argument("--transform", "-t", default="original")
+    parser.add_argument("--loomethod", default="exact", choices=["approximate", "exact"])
+    parser.add_argument("--backend", "-b", default="local", choices=["local", "slurm"])
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+    parser.add_argument("--sbatch", nargs="*", default=[])
+    parser.add_argument("--dryrun", type=str2bool, default=False)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+
+__all__ = ["BENCHMARK_METRICS", "STIMULUS_SETS", "BenchmarkRunner"]
+
+
+import time
+from os.path import join
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from .feature_store import feature_path, is_complete, open_features
+from .intrinsic_dimensionality import estimate_intrinsic_dimension, preprocess_features
+from .nights import load_nights_triplets, triplet_agreement, triplet_indices
+from .peterson import load_peterson_benchmark
+from .rsa_tools import CKATarget, class_separation
+
+
+# folder of the extracted features of each stimulus set, under `data`
+STIMULUS_SETS = {
+    "things": "features",
+    "nights": "nights_features",
+    "peterson": "peterson_features",
+}
+
+# metric -> stimulus set it is computed on
+BENCHMARK_METRICS = {
+    "cka": "things",
+    "class_separation": "things",
+    "intrinsic_dimensionality": "things",
+    "nights": "nights",
+    "peterson": "peterson",
+}
+
+
+class BenchmarkRunner:
+    def __init__(
+        self,
+        project_root: str,  # project root
+        metrics: Sequence[str] = tuple(BENCHMARK_METRICS),  # metrics to compute, keys of `BENCHMARK_METRICS`
+        cka_target: str = "task",  # features the CKA is computed against
+        chunk_size: int = 8192,  # number of rows read at once by CKA and class separation
+        memory_limit: float = 4e9,  # features of up to this many bytes are read into memory once and shared by the metrics, larger ones stay memory-mapped. Per process.
+        **id_kwargs,  # passed to `estimate_intrinsic_dimension`
+    ):
+        """
+        Compute several alignment metrics of a model, reading the features of each stimulus set once.
+
+        Everything the metrics share across models, like the CKA target statistics, the class labels,
+        and the NIGHTS and Peterson indices, is prepared once when the runner is created.
+        """
+        for metric in metrics:
+            assert metric in BENCHMARK_METRICS, f"{metric} must be one of {list(BENCHMARK_METRICS)}"
+        self.project_root = project_root
+        self.metrics = list(metrics)
+        self.chunk_size = chunk_size
+        self.memory_limit = memory_limit
+        self.id_kwargs = id_kwargs
+
+        features_dir = join(project_root, "data", STIMULUS_SETS["things"])
+        if "cka" in self.metrics:
+            self.cka_target = CKATarget(np.asarray(open_features(feature_path(features_dir, cka_target))), chunk_size=chunk_size)
+        if "class_separation" in self.metrics:
+            # the THINGS categories are the unique task embeddings
+            task_features = np.asarray(open_features(feature_path(features_dir, "task")))
+            self.class_labels = np.unique(task_features, axis=0, return_inverse=True)[1].reshape(-1)
+        if "nights" in self.metrics:
+            self.nights_triplets = triplet_indices(*load_nights_triplets(project_root))
+        if "peterson" in self.metrics:
+            self.peterson = load_peterson_benchmark(project_root)
+
+    def _compute(self, metric: str, features: np.ndarray) -> dict:
+        if metric == "cka":
+            return {"cka": self.cka_target(features)}
+        elif metric == "class_separation":
+            return {"r2": class_separation(features, self.class_labels, chunk_size=self.chunk_size)}
+        elif metric == "intrinsic_dimensionality":
+            return estimate_intrinsic_dimension(preprocess_features(features), **self.id_kwargs)
+        elif metric == "nights":
+            return {"nights": triplet_agreement(features, *self.nights_triplets)}
+        else:
+            return {"peterson": self.peterson(features)}
+
+    def run_model(
+        self,
+        model_name: str,  # name of the `.npy` files or chunked stores of the model
+    ) -> dict:  # metric values and the seconds each metric and the reading of each stimulus set took
+        """
+        Compute the metrics of one model. Metrics whose stimulus set has no features of the model are skipped.
+
+        The features of each stimulus set are read once for all its metrics if they fit in `memory_limit`.
+        """
+        row = {"feature": model_name}
+        for stimulus_set, folder in STIMULUS_SETS.items():
+            set_metrics = [metric for metric in self.metrics if BENCHMARK_METRICS[metric] == stimulus_set]
+            path = feature_path(join(self.project_root, "data", folder), model_name)
+            if not set_metrics or not is_complete(path):
+                continue
+
+            start = time.perf_counter()
+            features = open_features(path)
+            if np.prod(features.shape) * features.dtype.itemsize <= self.memory_limit:
+                features = np.asarray(features)
+            row[f"{stimulus_set} load time"] = time.perf_counter() - start
+            for metric in set_metrics:
+                start = time.perf_counter()
+                row.update(self._compute(metric, features))
+                row[f"{metric} time"] = time.perf_counter() - start
+
+        return row
+
+    def run(
+        self,
+        model_names: Sequence[str],  # names of the `.npy` files or chunked stores of the models
+        n_jobs: int | None = None,  # number of processes, see `joblib.Parallel`
+    ) -> pd.DataFrame:  # one row per model
+        """
+        Compute the metrics of many models in parallel processes, one model per task.
+        """
+        rows = Parallel(n_jobs=n_jobs)(delayed(self.run_model)(model_name) for model_name in model_names)
+        return pd.DataFrame(rows)
@@ -12,13 +12,11 @@ import torch
 from PIL import Image
 from sklearn.decomposition import PCA
 import fasttext
-from transformers import AutoTokenizer, AutoModel
 from thingsvision import get_extractor, get_extractor_from_model
 from thingsvision.utils.data import ImageDataset, DataLoader
 import tensorflow_hub as hub
 
 import tensorflow_hub as hub
-import openai
 
 
 from SLIP.models import (
@@ -34,19 +32,65 @@ from SLIP.models import (
 )
 
 from .helpers import get_project_root
+from .image_cache import CachedImageDataset, ImageCache
+from .pixel_pca import PCA_SOLVERS, pixel_pca
+from .text_embeddings import FastTextBackend, FunctionBackend, HuggingFaceBackend, OpenAIBackend, embed_texts
+from .feature_store import (
+    FeatureCache,
+    content_hash,
+    copy_features,
+    file_names_hash,
+    image_digests,
+    is_complete,
+    open_feature_writer,
+    open_features,
+    read_file_names,
+    read_progress,
+    write_features,
+)
 
 
 def extract_features(
     feature_name: str,  # same as model name. In case different encoders are available, it is in `model_encoder` format
     use_cached: bool = True,  # If `True`, rerun extraction even if the features are saved. Defaults to True.
+    store_format: str = "npy",  # 'npy' to save a single `.npy` file, 'chunked' to save a memory-mappable chunked store with metadata
+    storage_dtype: str | None = None,  # precision of the features on disk. One of 'float64', 'float32', 'float16', or 'bfloat16' for chunked stores. Defaults to the precision of the features for `.npy` files and to float32 otherwise.
+    streaming: bool = False,  # If `True`, write the activations of visual models batch by batch into the output instead of going through `data/temp`.
+    batch_size: int = 1,  # Number of images per forward pass when streaming.
+    num_workers: int = 0,  # Number of DataLoader workers when streaming, and of threads decoding images for the pixel PCA and the image cache.
+    content_cache: bool = False,  # If `True`, stream visual features through the content-addressed cache under `data/feature_cache`, which then decides whether they are up to date.
+    module_names: list | None = None,  # Extract these modules of a visual model in one pass, each saved under `layer_feature_path`, instead of the one in `model_configs.json`.
+    image_cache_size: int | None = None,  # If given, read decoded images from the cache under `data/image_cache` (built on first use) instead of decoding the JPEG files. Visual models use images of this size when streaming, the pixel PCA always uses 224.
+    pca_solver: str = "full",  # Solver of the pixel PCA baseline. 'full' fits `PCA` on all images in memory, 'incremental' and 'randomized' read the images in batches, see `naturalcogsci.pixel_pca.pixel_pca`.
+    pca_batch_size: int = 1024,  # Number of images in memory at once for the 'incremental' and 'randomized' pixel PCA.
+    text_batch_size: int = 256,  # Number of unique object names per forward pass or API request of language models.
 ) -> None:
     """
     Extract features from a model and save to disk.
+
+    The chunked store is a folder under `data/features` named after the features,
+    which `naturalcogsci.feature_store.open_features` reads back, upcasting to float32.
+
+    Streaming extraction checkpoints every batch, and with `use_cached` an interrupted
+    extraction continues from the last completed batch.
+
+    With `content_cache`, saved features of visual models are only reused if their model config,
+    module, weights, preprocessing and images match. See `get_visual_embedding`.
     """
+    store_formats = ["npy", "chunked"]
+    assert store_format in store_formats, f"{store_format} must be one of {store_formats}"
+    assert pca_solver in PCA_SOLVERS, f"{pca_solver} must be one of {PCA_SOLVERS}"
+    assert (
+        store_format == "chunked" or storage_dtype != "bfloat16"
+    ), "bfloat16 is only supported for chunked stores"
+
     project_root = get_project_root()
     final_feature_path = join(
         project_root, "data", "features", f"{feature_name.replace('/', '_')}.npy"
     )
+    if store_format == "chunked":
+        final_feature_path = os.path.splitext(final_feature_path)[0]
+    stream_dtype = storage_dtype or "float32"
 
     hugging_face_dict = {
         "distilbert": "distilbert-base-uncased",
@@ -54,7 +98,15 @@ def extract_features(
         "roberta": "roberta-base",
     }
 
-    if os.path.exists(final_feature_path) and use_cached:
+    non_visual_features = ["task", "ada-002", "bert", "roberta", "fasttext", "universal_sentence_encoder", "pca"]
+    visual = feature_name not in non_visual_features and "gLocal" not in feature_name
+
+    # the default output only stands in for the features asked for if no modules are given
+    if module_names is None and is_complete(final_feature_path) and use_cached and not (content_cache and visual):
+        return None
+    if module_names is not None and use_cached and all(
+        is_complete(layer_feature_path(final_feature_path, module_name)) for module_name in module_names
+    ):
         return None
 
     if feature_name == "task":
@@ -70,29 +122,17 @@ def extract_features(
         features = np.array(features)
 
     elif feature_name == "ada-002":
-        openai.api_key = os.getenv("OPENAI_API_KEY")
         objects = folder_to_word(remove_digit_underscore=True)
         objects = [f"A photo of a {x}" for x in objects]
-        features = np.array([get_ada_embedding(obj) for obj in objects])
+        # the API can be replaced by a local server through the `OPENAI_API_BASE` environment variable
+        features = embed_texts(objects, OpenAIBackend(batch_size=min(text_batch_size, 2048)))
 
     elif feature_name in ["bert", "roberta"]:
         objects = folder_to_word(remove_digit_underscore=True)
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        tokenizer = AutoTokenizer.from_pretrained(hugging_face_dict[feature_name])
-        model = AutoModel.from_pretrained(hugging_face_dict[feature_name]).to(device)
         objects = [f"A photo of a {x}" for x in objects]
-
-        tokenized_objects = tokenizer(
-            objects, padding=True, truncation=True, return_tensors="pt"
+        features = embed_texts(
+            objects, HuggingFaceBackend(hugging_face_dict[feature_name], batch_size=text_batch_size)
         )
-        tokenized_objects = {
-            k: torch.tensor(v).to(device) for k, v in tokenized_objects.items()
-        }
-
-        with torch.no_grad():
-            latent_objects = model(**tokenized_objects)
-
-        features = latent_objects.last_hidden_state[:, 0, :].numpy()
 
     elif feature_name == "fasttext":
         objects = folder_to_word(remove_digit_underscore=True)
@@ -104,29 +144,47 @@ def extract_features(
                 "crawl-300d-2M-subword.bin",
             )
         )
-        features = [ft.get_word_vector(x) for x in objects]
-        features = np.array(features)
+        features = embed_texts(objects, FastTextBackend(ft))
     elif feature_name == "universal_sentence_encoder":
         objects = folder_to_word(remove_digit_underscore=True)
         objects = [f"A photo of a {x}" for x in objects]
         module_url = "https://tfhub.dev/google/universal-sentence-encoder/4"
         model = hub.load(module_url)
-        features = model(objects).numpy()
+        features = embed_texts(objects, FunctionBackend(lambda x: model(x).numpy(), batch_size=text_batch_size))
 
     elif feature_name == "pca":
         with open(join(project_root, "data", "features", "file_names.txt"), "r") as f:
             file_paths = [line.strip() for line in f]
 
-        images = []
-        for file_path in tqdm(file_paths):
-            image = Image.open(file_path)
-            image = image.resize((224, 224))
-            images.append(np.array(image).flatten())
+        cache = None
+        if image_cache_size is not None:
+            cache = ImageCache.load(
+                join(project_root, "data", "image_cache", "224"), file_paths, size=224, n_jobs=num_workers or 1
+            )
 
-        data = np.stack(images)
-        # to match the dimensionality of the generative features
-        pca = PCA(n_components=49) 
-        features = pca.fit_transform(data)
+        if pca_solver != "full":
+            features = pixel_pca(
+                file_paths,
+                n_components=49,
+                solver=pca_solver,
+                batch_size=pca_batch_size,
+                n_jobs=num_workers or 1,
+                cache=cache,
+            )
+        else:
+            if cache is not None:
+                data = np.asarray(cache.images).reshape(len(cache), -1)
+            else:
+                images = []
+                for file_path in tqdm(file_paths):
+                    image = Image.open(file_path)
+                    image = image.resize((224, 224))
+                    images.append(np.array(image).flatten())
+
+                data = np.stack(images)
+            # to match the dimensionality of the generative features
+            pca = PCA(n_components=49)
+            features = pca.fit_transform(data)
 
     elif "gLocal" in feature_name:
         # split feature_name by gLocal
@@ -143,11 +201,38 @@ def extract_features(
         if "bias" in glocal_transform:
             features += glocal_transform["bias"]
 
+    elif streaming or content_cache or module_names is not None:
+        get_visual_embedding(
+            project_root,
+            feature_name,
+            output_path=final_feature_path,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            store_format=store_format,
+            storage_dtype=stream_dtype,
+            resume=use_cached,
+            content_cache=content_cache,
+            module_names=module_names,
+            image_cache_size=image_cache_size,
+        )
+        return None
+
     else:
         features = get_visual_embedding(project_root, feature_name)
 
-    feature_name = feature_name.replace("/", "_")
-    np.save(final_feature_path, features)
+    if store_format == "chunked":
+        with open(join(project_root, "data", "model_configs.json")) as f:
+            model_config = json.load(f).get(feature_name, {})
+        write_features(
+            final_feature_path,
+            np.asarray(features),
+            storage_dtype=stream_dtype,
+            model_name=os.path.basename(final_feature_path),
+            module_name=model_config.get("module_name"),
+            row_order_hash=file_names_hash(join(project_root, "data", "features", "file_names.txt")),
+        )
+    else:
+        np.save(final_feature_path, features if storage_dtype is None else np.asarray(features, dtype=storage_dtype))
 
     return None
 
@@ -175,9 +260,33 @@ def folder_to_word(remove_digit_underscore: bool,  # Remove digit and underscore
 def get_visual_embedding(
     project_root: str,  # Root directory of the project
     feature_name: str,  # Name of the feature to extract. Must be in `model_config.json`
-) -> np.ndarray:  # total images by features array
+    output_path: str | None = None,  # If given, stream the features into this `.npy` file or chunked store instead of returning them
+    batch_size: int = 1,  # Number of images per forward pass when streaming
+    num_workers: int = 0,  # Number of DataLoader workers when streaming
+    store_format: str = "npy",  # 'npy' or 'chunked' output when streaming
+    storage_dtype: str = "float32",  # precision of the output when streaming
+    resume: bool = True,  # continue an interrupted streaming extraction
+    content_cache: bool = False,  # reuse features from the content-addressed cache under `data/feature_cache` when streaming
+    stimuli_path: str | None = None,  # folder of the images. Defaults to the THINGS images under `stimuli`.
+    features_dir: str | None = None,  # folder `file_names.txt` is written to. Defaults to `data/features`.
+    module_names: list | None = None,  # extract all these modules in one pass instead of the one in `model_configs.json`, each into `layer_feature_path(output_path, module_name)`
+    image_cache_size: int | None = None,  # when streaming, read the images decoded at this size from the cache under `data/image_cache`
+) -> np.ndarray | None:  # total images by features array, if not streaming
     """
     Extract visual embedding using `thingsvision`
+
+    By default, the activations of every image are saved under `data/temp` and then combined.
+    With `output_path`, the activations of each batch are written straight into a
+    preallocated, memory-mapped output.
+
+    With `content_cache`, features are extracted into a cache keyed by the model config,
+    module, weights and preprocessing, including the decoding of cached images,
+    and by the digests of the images in order. They are only reused
+    if all of these match, and images that are part of other cached stimulus sets
+    (e.g. THINGS, NIGHTS and Peterson) are copied rather than extracted again.
+
+    With `module_names`, the model is only loaded and run once for all modules.
+    This requires a PyTorch model and does not use the content-addressed cache.
     """
 
     pretrained = True
@@ -199,17 +308,16 @@ def get_visual_embedding(
     model_config = file[feature_name]
     device = "cuda" if torch.cuda.is_available() else "cpu"
     model_parameters = None
+    weights_path = None
     save_name = feature_name
     if "slip" in feature_name:
-        weights = torch.load(
-            join(
-                project_root,
-                "data",
-                "embedding_weights_and_binaries",
-                f"{feature_name}.pth",
-            ),
-            map_location=device,
+        weights_path = join(
+            project_root,
+            "data",
+            "embedding_weights_and_binaries",
+            f"{feature_name}.pth",
         )
+        weights = torch.load(weights_path, map_location=device)
 
         model = slip_variants[feature_name](
             ssl_mlp_dim=weights["args"].ssl_mlp_dim,
@@ -259,15 +367,116 @@ def get_visual_embedding(
             model_parameters=model_parameters,
         )
 
-    stimuli_path = join(project_root, "stimuli")
-    batch_size = 1
+    if stimuli_path is None:
+        stimuli_path = join(project_root, "stimuli")
+    if features_dir is None:
+        features_dir = join(project_root, "data", "features")
 
     dataset = ImageDataset(
         root=stimuli_path,
-        out_path=join(project_root, "data", "features"),
+        out_path=features_dir,
         backend=extractor.get_backend(),
         transforms=extractor.get_transformations(),
     )
+
+    if output_path is not None:
+        file_paths = read_file_names(join(features_dir, "file_names.txt"), prefix=None)
+        order_hash = file_names_hash(join(features_dir, "file_names.txt"))
+        if image_cache_size is not None:
+            # the images are resized once, before the model's own transforms
+            image_cache = ImageCache.load(
+                join(project_root, "data", "image_cache", str(image_cache_size)),
+                file_paths,
+                size=image_cache_size,
+                n_jobs=num_workers or 1,
+            )
+            dataset = CachedImageDataset(image_cache, transforms=extractor.get_transformations())
+        stream_kwargs = dict(
+            module_name=model_config["module_name"],
+            batch_size=batch_size,
+            num_workers=num_workers,
+            model_name=save_name.replace("/", "_"),
+        )
+
+        if module_names is not None:
+            stream_layer_features(
+                extractor,
+                dataset,
+                {module_name: layer_feature_path(output_path, module_name) for module_name in module_names},
+                batch_size=batch_size,
+                num_workers=num_workers,
+                store_format=store_format,
+                storage_dtype=storage_dtype,
+                resume=resume,
+                model_name=stream_kwargs["model_name"],
+                row_order_hash=order_hash,
+            )
+            return None
+
+        if not content_cache:
+            stream_features(
+                extractor,
+                dataset,
+                output_path=output_path,
+                store_format=store_format,
+                storage_dtype=storage_dtype,
+                resume=resume,
+                row_order_hash=order_hash,
+                **stream_kwargs,
+            )
+            return None
+
+        cache = FeatureCache(join(project_root, "data", "feature_cache"))
+        digests = image_digests(file_paths, memo_path=join(cache.root, "image_digests.json"))
+        # everything that changes the pixels the model sees or its weights
+        model_key = content_hash(
+            save_name,
+            model_config,
+            model_parameters,
+            pretrained,
+            image_digests([weights_path], memo_path=join(cache.root, "image_digests.json")) if weights_path else None,
+            repr(extractor.get_transformations()),
+            image_cache.decode_params if image_cache_size is not None else None,
+        )
+        stimuli_key = content_hash(digests)
+        cache_path = cache.store_path(model_key, stimuli_key)
+
+        if not is_complete(cache_path):
+            stream_features(
+                extractor,
+                dataset,
+                output_path=cache_path,
+                store_format="chunked",
+                resume=True,
+                prefill=cache.lookup(model_key, digests),
+                stimuli_key=stimuli_key,
+                **stream_kwargs,
+            )
+            cache.register(model_key, stimuli_key, digests)
+
+        # the output only needs to be rewritten if it came from a different cache entry
+        cache_key = f"{model_key}/{stimuli_key}"
+        key_path = f"{output_path.rstrip(os.sep)}.cache_key"
+        if os.path.exists(key_path) and is_complete(output_path):
+            with open(key_path) as f:
+                if f.read() == cache_key:
+                    return None
+
+        copy_features(
+            cache_path,
+            output_path,
+            store_format=store_format,
+            storage_dtype=storage_dtype,
+            model_name=stream_kwargs["model_name"],
+            module_name=model_config["module_name"],
+            row_order_hash=order_hash,
+            cache_key=cache_key,
+        )
+        with open(key_path, "w") as f:
+            f.write(cache_key)
+        return None
+
+    batch_size = 1
     batches = DataLoader(
         dataset=dataset, batch_size=batch_size, backend=extractor.get_backend()
     )
@@ -285,6 +494,195 @@ def get_visual_embedding(
     return features
 
 
+def stream_features(
+    extractor,  # thingsvision extractor
+    dataset: ImageDataset,  # images to extract features for
+    module_name: str,  # module to extract the activations of
+    output_path: str,  # `.npy` file or chunked store to write into
+    batch_size: int = 64,  # number of images per forward pass
+    num_workers: int = 0,  # number of DataLoader workers
+    store_format: str = "npy",  # 'npy' or 'chunked'
+    storage_dtype: str = "float32",  # precision of the output
+    resume: bool = True,  # continue from the last completed batch of an interrupted output
+    prefill: dict | None = None,  # features that are already extracted: source store -> (rows to fill, rows of the source)
+    **metadata,  # saved along chunked stores, e.g. model_name and row_order_hash
+) -> None:
+    """
+    Run the images through the extractor batch by batch and write the activations
+    straight into a preallocated, memory-mapped output in the order of the dataset.
+
+    Every batch is checkpointed in a progress manifest. If a previous run with the same
+    shape, precision and metadata was interrupted, only the remaining images are extracted.
+    Rows given in `prefill` are copied from their source instead of being extracted.
+    """
+    n_rows = len(dataset)
+    writer = None
+
+    def _open_writer(n_features, resume=False):
+        return open_feature_writer(
+            output_path,
+            n_rows,
+            n_features,
+            store_format=store_format,
+            storage_dtype=storage_dtype,
+            resume=resume,
+            module_name=module_name,
+            **metadata,
+        )
+
+    progress = read_progress(output_path, store_format) if resume else None
+    if progress is not None and progress["n_rows"] == n_rows:
+        writer = _open_writer(progress["n_features"], resume=True)
+
+    for source, (rows, source_rows) in (prefill or {}).items():
+        source_features = open_features(source)
+        if writer is None:
+            writer = _open_writer(source_features.shape[1])
+        order = np.argsort(rows)
+        writer.write_rows(rows[order], np.asarray(source_features[source_rows[order]]))
+
+    rows = writer.missing_rows() if writer is not None else np.arange(n_rows)
+    if len(rows) < n_rows:
+        print(f"Extracting the remaining {len(rows)} of {n_rows} images", flush=True)
+    dataset = torch.utils.data.Subset(dataset, rows)
+
+    if extractor.get_backend() == "pt":
+        batches = torch.utils.data.DataLoader(
+            dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers
+        )
+    else:
+        batches = DataLoader(
+            dataset=dataset, batch_size=batch_size, backend=extractor.get_backend()
+        )
+
+    start = 0
+    for batch in tqdm(batches, desc=metadata.get("model_name")):
+        features = batch_features(extractor, batch, module_name)
+        if writer is None:
+            writer = _open_writer(features.shape[1])
+        writer.write_rows(rows[start : start + len(features)], features)
+        start += len(features)
+
+    writer.close()
+
+
+def batch_features(
+    extractor,  # thingsvision extractor
+    batch,  # batch of transformed images
+    module_name: str,  # module to extract the activations of
+) -> np.ndarray:  # images by features array
+    """
+    Extract the activations of a batch, keeping the same part of them as `cleanup_temp`.
+    """
+    features = np.asarray(
+        extractor.extract_batch(batch=batch, module_name=module_name, flatten_acts=False)
+    )
+
+    return _reduce_activations(features)
+
+
+def _reduce_activations(
+    features: np.ndarray,  # activations of a batch
+) -> np.ndarray:  # images by features array
+    # index into 0 to extract the CLS from pytorch transformers
+    if features.ndim == 3:
+        features = features[:, 0, :]
+
+    return features.reshape(len(features), -1)
+
+
+def layer_feature_path(
+    path: str,  # `.npy` file or chunked store of the model
+    module_name: str,  # module the features are taken from
+) -> str:  # `.npy` file or chunked store of the module
+    """
+    Name the output of one module of a multi-module extraction after the model and the module.
+    """
+    root, extension = os.path.splitext(path)
+    module_name = module_name.replace(".", "_").replace("/", "_")
+    return f"{root}_{module_name}{extension}"
+
+
+def stream_layer_features(
+    extractor,  # thingsvision extractor with a PyTorch backend
+    dataset: ImageDataset,  # images to extract features for
+    output_paths: dict,  # module name -> `.npy` file or chunked store to write into
+    batch_size: int = 64,  # number of images per forward pass
+    num_workers: int = 0,  # number of DataLoader workers
+    store_format: str = "npy",  # 'npy' or 'chunked'
+    storage_dtype: str = "float32",  # precision of the outputs
+    resume: bool = True,  # continue from the last completed batch of interrupted outputs
+    **metadata,  # saved along chunked stores, e.g. model_name and row_order_hash
+) -> None:
+    """
+    Capture the activations of several modules with forward hooks in a single forward pass
+    per batch, and write each of them into its own output like `stream_features`.
+
+    Images that are missing from any of the outputs are extracted again for all of them.
+    """
+    n_rows = len(dataset)
+    writers = {}
+
+    def _open_writer(module_name, n_features, resume=False):
+        return open_feature_writer(
+            output_paths[module_name],
+            n_rows,
+            n_features,
+            store_format=store_format,
+            storage_dtype=storage_dtype,
+            resume=resume,
+            module_name=module_name,
+            **metadata,
+        )
+
+    for module_name, output_path in output_paths.items():
+        progress = read_progress(output_path, store_format) if resume else None
+        if progress is not None and progress["n_rows"] == n_rows:
+            writers[module_name] = _open_writer(module_name, progress["n_features"], resume=True)
+
+    if len(writers) == len(output_paths):
+        rows = np.unique(np.concatenate([writer.missing_rows() for writer in writers.values()]))
+    else:
+        rows = np.arange(n_rows)
+    dataset = torch.utils.data.Subset(dataset, rows)
+    batches = torch.utils.data.DataLoader(
+        dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers
+    )
+
+    activations = {}
+
+    def _hook(module_name):
+        def _store(module, inputs, outputs):
+            # some modules, e.g. attention blocks, return tuples
+            if isinstance(outputs, (tuple, list)):
+                outputs = outputs[0]
+            activations[module_name] = outputs.detach().cpu().numpy()
+
+        return _store
+
+    modules = dict(extractor.model.named_modules())
+    handles = [modules[module_name].register_forward_hook(_hook(module_name)) for module_name in output_paths]
+
+    try:
+        start = 0
+        for batch in tqdm(batches, desc=metadata.get("model_name")):
+            with torch.no_grad():
+                extractor.forward(batch.to(extractor.device))
+
+            for module_name in output_paths:
+                features = _reduce_activations(activations[module_name])
+                if module_name not in writers:
+                    writers[module_name] = _open_writer(module_name, features.shape[1])
+                writers[module_name].write_rows(rows[start : start + len(features)], features)
+            start += len(batch)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    for writer in writers.values():
+        writer.close()
+
+
 def cleanup_temp(
     project_root: str,  # Root directory of the project
     save_name: str,  # name of the feature. has to match folder name under temp
@@ -314,13 +712,3 @@ def cleanup_temp(
 
     return feature_array
 
-
-def get_ada_embedding(
-    text: str,  # Sentence to be embedded
-    model: str = "text-embedding-ada-002",  # Model to get embeddings from. Defaults to "text-embedding-ada-002".
-) -> np.ndarray:  # word vector
-    """
-    Generate word embeddings from openai ada model.
-    """
-    text = text.replace("\n", " ")
-    return openai.Embedding.create(input=[text], model=model)["data"][0]["embedding"]
@@ -0,0 +1,697 @@
+from __future__ import annotations
+
+
+__all__ = [
+    "FeatureStore",
+    "ChunkedFeatures",
+    "ChunkedFeatureWriter",
+    "NpyFeatureWriter",
+    "open_feature_writer",
+    "read_progress",
+    "is_complete",
+    "copy_features",
+    "content_hash",
+    "image_digests",
+    "file_digest",
+    "FeatureCache",
+    "open_features",
+    "find_features",
+    "feature_name",
+    "feature_path",
+    "write_features",
+    "read_file_names",
+    "row_order_hash",
+    "file_names_hash",
+]
+
+
+import hashlib
+import json
+import os
+import tempfile
+from os.path import join, dirname, isdir
+from typing import Sequence
+
+import numpy as np
+
+
+STORAGE_DTYPES = ["float64", "float32", "float16", "bfloat16"]
+
+
+def read_file_names(
+    path: str,  # path to a `file_names.txt` file
+    prefix: str | None = "naturalcogsci/",  # Only keep what comes after this in each path. If `None`, keep the full path.
+) -> list:  # image paths in the order of the feature rows
+    """
+    Read the image paths that thingsvision writes next to the extracted features.
+    """
+    with open(path, "r") as f:
+        file_names = f.read().split("\n")
+
+    file_names = [file_name for file_name in file_names if file_name]
+    if prefix is not None:
+        # images outside the project folder, e.g. of other stimulus sets, keep their full path
+        file_names = [file_name.split(prefix)[1] if prefix in file_name else file_name for file_name in file_names]
+
+    return file_names
+
+
+def row_order_hash(
+    file_names: Sequence[str],  # image paths in the order of the feature rows
+) -> str:  # hex digest
+    """
+    Hash the row order of a feature matrix, so stores extracted for different image lists can be told apart.
+    """
+    return hashlib.sha1("\n".join(file_names).encode()).hexdigest()
+
+
+def file_names_hash(
+    path: str,  # path to a `file_names.txt` file
+) -> str:  # hex digest
+    """
+    Row order hash of the features extracted next to a `file_names.txt`, on the image paths
+    without the project folder, as recorded in chunked stores and checked by `FeatureStore`.
+    """
+    return row_order_hash(read_file_names(path))
+
+
+def _encode(
+    rows: np.ndarray,  # features
+    storage_dtype: str,  # one of `STORAGE_DTYPES`
+) -> np.ndarray:  # features as stored on disk
+    if storage_dtype != "bfloat16":
+        return np.asarray(rows, dtype=storage_dtype)
+
+    # numpy has no bfloat16, so keep the upper 16 bits of float32 with round to nearest even
+    bits = np.ascontiguousarray(rows, dtype=np.float32).view(np.uint32)
+    rounding = ((bits >> 16) & 1) + np.uint32(0x7FFF)
+    return ((bits + rounding) >> 16).astype(np.uint16)
+
+
+def _decode(
+    rows: np.ndarray,  # features as stored on disk
+    storage_dtype: str,  # one of `STORAGE_DTYPES`
+    dtype: str,  # dtype to upcast to
+) -> np.ndarray:  # features
+    if storage_dtype == "bfloat16":
+        rows = (rows.astype(np.uint32) << 16).view(np.float32)
+    return rows.astype(dtype, copy=False)
+
+
+def _dump_json(
+    path: str,  # file to write
+    content: dict,  # JSON serialisable content
+):
+    """
+    Write a JSON file atomically, so it is never read half-written.
+    """
+    # a unique temporary file, as several threads or processes may write the same file
+    fd, temp_path = tempfile.mkstemp(dir=dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(content, f, indent=4)
+    # `mkstemp` makes files only readable by their owner
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+def _progress_path(
+    path: str,  # `.npy` file, or directory of a chunked store
+    store_format: str,  # 'npy' or 'chunked'
+) -> str:  # path of the progress manifest
+    if store_format == "chunked":
+        return join(path, "progress.json")
+    return f"{path}.partial.progress.json"
+
+
+def read_progress(
+    path: str,  # `.npy` file, or directory of a chunked store
+    store_format: str = "npy",  # 'npy' or 'chunked'
+) -> dict | None:  # progress manifest, if an incomplete output exists
+    """
+    Read the manifest of an interrupted extraction, which records the shape, precision,
+    metadata and the ranges of rows that were completely written.
+    """
+    progress_path = _progress_path(path, store_format)
+    if not os.path.exists(progress_path):
+        return None
+    with open(progress_path) as f:
+        return json.load(f)
+
+
+def _remove_stale(*paths: str | None):
+    # files of an earlier output that must not outlive the start of a new one
+    for path in paths:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+
+class _CheckpointedWriter:
+    """
+    Bookkeeping of the rows written so far, shared by the feature writers.
+    """
+
+    def _start_progress(self, progress_path, resume, **manifest) -> bool:
+        self.progress_path = progress_path
+        self.manifest = manifest
+        self.completed = []
+
+        progress = None
+        if resume and os.path.exists(progress_path):
+            with open(progress_path) as f:
+                progress = json.load(f)
+
+        if progress is not None and {k: progress.get(k) for k in manifest} == manifest:
+            self.completed = progress["completed"]
+            return True
+        return False
+
+    def _checkpoint(self, start: int, end: int):
+        ranges = sorted(self.completed + [[start, end]])
+        merged = [ranges[0]]
+        for range_start, range_end in ranges[1:]:
+            if range_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+        self.completed = merged
+        _dump_json(self.progress_path, {**self.manifest, "completed": self.completed})
+
+    def missing_rows(self) -> np.ndarray:
+        """
+        Rows that have not been written yet.
+        """
+        done = np.zeros(self.manifest["n_rows"], dtype=bool)
+        for start, end in self.completed:
+            done[start:end] = True
+        return np.flatnonzero(~done)
+
+    def write_rows(
+        self,
+        rows: np.ndarray,  # row of each feature vector
+        features: np.ndarray,  # rows x features
+    ):
+        """
+        Write rows that need not be consecutive, one run of consecutive rows at a time.
+        """
+        rows = np.asarray(rows)
+        runs = np.split(np.arange(len(rows)), np.flatnonzero(np.diff(rows) != 1) + 1)
+        for run in runs:
+            if len(run):
+                self.write(int(rows[run[0]]), features[run])
+
+
+class ChunkedFeatureWriter(_CheckpointedWriter):
+    def __init__(
+        self,
+        path: str,  # directory of the store
+        n_rows: int,  # number of images
+        n_features: int,  # number of features
+        storage_dtype: str = "float32",  # precision on disk. One of 'float64', 'float32', 'float16' or 'bfloat16'.
+        dtype: str = "float32",  # precision the features are read back in
+        chunk_rows: int = 4096,  # number of rows per chunk file
+        resume: bool = False,  # Continue an interrupted store with the same shape, precision and metadata instead of starting over.
+        **metadata,  # saved along the features, e.g. model_name, module_name and row_order_hash
+    ):
+        """
+        Write features into a directory of fixed-size `.npy` chunks that are memory-mapped,
+        so rows can be written in any order without holding the whole matrix in memory.
+
+        Every write is flushed and recorded in `progress.json`, so an interrupted
+        extraction can be resumed. The metadata is removed when writing starts and written
+        by `close`, so a store without it is incomplete.
+        """
+        assert storage_dtype in STORAGE_DTYPES, f"{storage_dtype} must be one of {STORAGE_DTYPES}"
+
+        self.path = path
+        self.n_rows = n_rows
+        self.n_features = n_features
+        self.storage_dtype = storage_dtype
+        self.dtype = dtype
+        self.chunk_rows = chunk_rows
+        self.metadata = metadata
+
+        os.makedirs(path, exist_ok=True)
+        resumed = self._start_progress(
+            _progress_path(path, "chunked"),
+            resume,
+            n_rows=n_rows,
+            n_features=n_features,
+            storage_dtype=storage_dtype,
+            chunk_rows=chunk_rows,
+            metadata=metadata,
+        )
+        # the store is incomplete until `close`, even if it replaces a complete one
+        _remove_stale(join(path, "metadata.json"), None if resumed else self.progress_path)
+
+        disk_dtype = np.uint16 if storage_dtype == "bfloat16" else storage_dtype
+        self.chunks = []
+        for chunk, start in enumerate(range(0, n_rows, chunk_rows)):
+            chunk_path = join(path, f"chunk_{chunk:05d}.npy")
+            shape = (min(chunk_rows, n_rows - start), n_features)
+            if resumed:
+                self.chunks.append(np.load(chunk_path, mmap_mode="r+"))
+            else:
+                self.chunks.append(np.lib.format.open_memmap(chunk_path, mode="w+", dtype=disk_dtype, shape=shape))
+
+    def write(
+        self,
+        start: int,  # first row to write
+        rows: np.ndarray,  # rows x features
+    ):
+        """
+        Write consecutive rows starting from `start`.
+        """
+        rows = _encode(rows, self.storage_dtype)
+        first, end = start, start + len(rows)
+        while start < end:
+            chunk, offset = divmod(start, self.chunk_rows)
+            size = min(end - start, self.chunk_rows - offset)
+            self.chunks[chunk][offset : offset + size] = rows[: size]
+            self.chunks[chunk].flush()
+            rows = rows[size:]
+            start += size
+
+        self._checkpoint(first, end)
+
+    def close(self):
+        """
+        Flush the chunks and write the metadata.
+        """
+        for chunk in self.chunks:
+            chunk.flush()
+
+        metadata = {
+            "shape": [self.n_rows, self.n_features],
+            "dtype": self.dtype,
+            "storage_dtype": self.storage_dtype,
+            "chunk_rows": self.chunk_rows,
+            **self.metadata,
+        }
+        _dump_json(join(self.path, "metadata.json"), metadata)
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+
+class NpyFeatureWriter(_CheckpointedWriter):
+    def __init__(
+        self,
+        path: str,  # path of the `.npy` file
+        n_rows: int,  # number of images
+        n_features: int,  # number of features
+        dtype: str = "float32",  # precision of the file
+        resume: bool = False,  # Continue an interrupted file with the same shape, precision and metadata instead of starting over.
+        **metadata,  # only used to check that an interrupted file can be resumed
+    ):
+        """
+        Write rows into a preallocated, memory-mapped `.npy` file.
+
+        Rows go to a `.partial` file that only replaces `path` on `close`,
+        so an interrupted extraction never looks complete. Every write is flushed
+        and recorded in a progress manifest next to it, so it can be resumed.
+        """
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        resumed = self._start_progress(
+            _progress_path(path, "npy"),
+            resume and os.path.exists(self.partial_path),
+            n_rows=n_rows,
+            n_features=n_features,
+            storage_dtype=dtype,
+            metadata=metadata,
+        )
+        if not resumed:
+            _remove_stale(self.progress_path)
+        self.features = np.lib.format.open_memmap(
+            self.partial_path,
+            mode="r+" if resumed else "w+",
+            dtype=dtype,
+            shape=(n_rows, n_features),
+        )
+
+    def write(
+        self,
+        start: int,  # first row to write
+        rows: np.ndarray,  # rows x features
+    ):
+        """
+        Write consecutive rows starting from `start`.
+        """
+        self.features[start : start + len(rows)] = rows
+        self.features.flush()
+        self._checkpoint(start, start + len(rows))
+
+    def close(self):
+        """
+        Flush the file and move it to its final path.
+        """
+        self.features.flush()
+        del self.features
+        os.replace(self.partial_path, self.path)
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+
+def open_feature_writer(
+    path: str,  # `.npy` file, or directory of a chunked store
+    n_rows: int,  # number of images
+    n_features: int,  # number of features
+    store_format: str = "npy",  # 'npy' or 'chunked'
+    storage_dtype: str = "float32",  # precision on disk
+    resume: bool = False,  # continue an interrupted output if it is compatible
+    **metadata,  # saved along chunked stores
+) -> NpyFeatureWriter | ChunkedFeatureWriter:
+    """
+    Make the writer for the given store format.
+    """
+    if store_format == "chunked":
+        return ChunkedFeatureWriter(path, n_rows, n_features, storage_dtype=storage_dtype, resume=resume, **metadata)
+    return NpyFeatureWriter(path, n_rows, n_features, dtype=storage_dtype, resume=resume, **metadata)
+
+
+def is_complete(
+    path: str,  # `.npy` file, or directory of a chunked store
+) -> bool:
+    """
+    Check whether a feature file or chunked store was completely written.
+    """
+    if isdir(path):
+        return os.path.exists(join(path, "metadata.json"))
+    return os.path.exists(path)
+
+
+class ChunkedFeatures:
+    def __init__(
+        self,
+        path: str,  # directory of the store
+    ):
+        """
+        Read-only, array-like view of a store written by `ChunkedFeatureWriter`.
+
+        Indexing with rows only reads those rows from the memory-mapped chunks,
+        and upcasts them to the dtype in the metadata.
+        """
+        self.path = path
+        with open(join(path, "metadata.json")) as f:
+            self.metadata = json.load(f)
+
+        self.shape = tuple(self.metadata["shape"])
+        self.dtype = np.dtype(self.metadata["dtype"])
+        self.storage_dtype = self.metadata["storage_dtype"]
+        self.chunk_rows = self.metadata["chunk_rows"]
+        n_chunks = -(-self.shape[0] // self.chunk_rows)
+        self.chunks = [np.load(join(path, f"chunk_{chunk:05d}.npy"), mmap_mode="r") for chunk in range(n_chunks)]
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def ndim(self) -> int:
+        return 2
+
+    def __getitem__(self, key) -> np.ndarray:
+        if isinstance(key, tuple):
+            rows, columns = key[0], key[1:]
+            return self[rows][(slice(None),) + columns]
+
+        if isinstance(key, slice):
+            key = np.arange(*key.indices(self.shape[0]))
+        rows = np.asarray(key)
+        scalar = rows.ndim == 0
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        rows = np.atleast_1d(rows) % self.shape[0]
+
+        chunk_ids, offsets = np.divmod(rows, self.chunk_rows)
+        out = np.empty((len(rows), self.shape[1]), dtype=self.dtype)
+        for chunk in np.unique(chunk_ids):
+            mask = chunk_ids == chunk
+            out[mask] = _decode(self.chunks[chunk][offsets[mask]], self.storage_dtype, self.dtype)
+
+        return out[0] if scalar else out
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        features = self[:]
+        return features if dtype is None else features.astype(dtype)
+
+
+def open_features(
+    path: str,  # `.npy` file or directory of a chunked store
+    row_order_hash: str | None = None,  # expected row order, see `file_names_hash`. Checked against chunked stores that record one.
+) -> np.ndarray | ChunkedFeatures:  # memory-mapped features
+    """
+    Open extracted features for reading without loading them into memory.
+    """
+    if not isdir(path):
+        return np.load(path, mmap_mode="r")
+
+    features = ChunkedFeatures(path)
+    stored_hash = features.metadata.get("row_order_hash")
+    if row_order_hash is not None and stored_hash is not None and stored_hash != row_order_hash:
+        raise ValueError(f"The rows of {path} were extracted for other images or in another order than expected")
+    return features
+
+
+def find_features(
+    folder: str,  # folder of extracted features, e.g. `data/features`
+) -> list:  # `.npy` files and complete chunked stores in the folder
+    """
+    List the extracted features of a folder in either format.
+    """
+    paths = []
+    for name in sorted(os.listdir(folder)):
+        path = join(folder, name)
+        if (name.endswith(".npy") or isdir(path)) and is_complete(path):
+            paths.append(path)
+    return paths
+
+
+def feature_name(
+    path: str,  # `.npy` file or directory of a chunked store
+) -> str:  # name of the features, e.g. the model
+    name = os.path.basename(path.rstrip(os.sep))
+    return name[: -len(".npy")] if name.endswith(".npy") else name
+
+
+def feature_path(
+    folder: str,  # folder of extracted features, e.g. `data/features`
+    name: str,  # name of the features, e.g. the model
+) -> str:  # `.npy` file of the features if it exists, and their chunked store otherwise
+    path = join(folder, f"{name}.npy")
+    return path if os.path.exists(path) else join(folder, name)
+
+
+def write_features(
+    path: str,  # directory of the store
+    features: np.ndarray,  # images x features
+    storage_dtype: str = "float32",  # precision on disk. One of 'float64', 'float32', 'float16' or 'bfloat16'.
+    chunk_rows: int = 4096,  # number of rows per chunk file
+    **metadata,  # saved along the features
+):
+    """
+    Save an in-memory feature matrix as a chunked store.
+    """
+    writer = ChunkedFeatureWriter(
+        path,
+        features.shape[0],
+        features.shape[1],
+        storage_dtype=storage_dtype,
+        dtype="float64" if features.dtype == np.float64 else "float32",
+        chunk_rows=chunk_rows,
+        **metadata,
+    )
+    for start in range(0, features.shape[0], chunk_rows):
+        writer.write(start, features[start : start + chunk_rows])
+    writer.close()
+
+
+def copy_features(
+    source: str,  # `.npy` file or chunked store to copy from
+    path: str,  # `.npy` file or chunked store to copy to
+    store_format: str = "npy",  # format of the copy
+    storage_dtype: str = "float32",  # precision of the copy
+    chunk_rows: int = 4096,  # number of rows copied at a time
+    **metadata,  # saved along chunked stores
+):
+    """
+    Copy features between files or stores of any format without loading them at once.
+    """
+    features = open_features(source)
+    writer = open_feature_writer(
+        path, features.shape[0], features.shape[1], store_format=store_format, storage_dtype=storage_dtype, **metadata
+    )
+    for start in range(0, features.shape[0], chunk_rows):
+        writer.write(start, np.asarray(features[start : start + chunk_rows]))
+    writer.close()
+
+
+def content_hash(
+    *parts,  # JSON serialisable content, e.g. model configs and lists of image digests
+) -> str:  # hex digest
+    """
+    Hash the given content in an order-preserving and reproducible way.
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_digest(
+    path: str,  # any file
+    block_size: int = 1 << 20,  # number of bytes read at once
+) -> str:  # hex digest of the content
+    """
+    Hash the content of a file in fixed-size blocks, so files larger than memory, like feature stores, can be hashed.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def image_digests(
+    paths: Sequence[str],  # image files, or any other files
+    memo_path: str | None = None,  # JSON file remembering the digests of files that have not changed since
+) -> list:  # content hash of every image
+    """
+    Hash the content of image files, so the same image is recognised in any stimulus set.
+    """
+    memo = {}
+    if memo_path is not None and os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+
+    digests = []
+    new_digests = False
+    for path in paths:
+        stat = os.stat(path)
+        key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+        if key not in memo:
+            memo[key] = file_digest(path)
+            new_digests = True
+        digests.append(memo[key])
+
+    if memo_path is not None and new_digests:
+        _dump_json(memo_path, memo)
+
+    return digests
+
+
+class FeatureCache:
+    def __init__(
+        self,
+        root: str,  # directory of the cache
+    ):
+        """
+        Content-addressed cache of extracted features.
+
+        Features are stored under a key of everything that determines them (e.g. model config,
+        module and preprocessing), in one chunked store per ordered list of image digests.
+        An index per model key maps image digests to rows of complete stores, so images
+        shared between stimulus sets are only extracted once.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def store_path(
+        self,
+        model_key: str,  # hash of what determines the features
+        stimuli_key: str,  # hash of the ordered image digests
+    ) -> str:  # directory of the chunked store
+        return join(self.root, model_key, stimuli_key)
+
+    def _index_path(self, model_key: str) -> str:
+        return join(self.root, model_key, "index.json")
+
+    def read_index(
+        self,
+        model_key: str,  # hash of what determines the features
+    ) -> dict:  # image digest -> [stimuli key, row]
+        index_path = self._index_path(model_key)
+        if not os.path.exists(index_path):
+            return {}
+        with open(index_path) as f:
+            return json.load(f)
+
+    def register(
+        self,
+        model_key: str,  # hash of what determines the features
+        stimuli_key: str,  # hash of the ordered image digests
+        digests: Sequence[str],  # image digests in the order of the store rows
+    ):
+        """
+        Add the images of a complete store to the index.
+        """
+        index = self.read_index(model_key)
+        for row, digest in enumerate(digests):
+            index.setdefault(digest, [stimuli_key, row])
+        _dump_json(self._index_path(model_key), index)
+
+    def lookup(
+        self,
+        model_key: str,  # hash of what determines the features
+        digests: Sequence[str],  # image digests of the rows to fill
+    ) -> dict:  # store path -> (rows to fill, rows of that store)
+        """
+        Find the images that were already extracted as part of other stimulus sets.
+        """
+        index = self.read_index(model_key)
+        hits = {}
+        for row, digest in enumerate(digests):
+            if digest not in index:
+                continue
+            stimuli_key, source_row = index[digest]
+            source = self.store_path(model_key, stimuli_key)
+            if is_complete(source):
+                hits.setdefault(source, ([], []))
+                hits[source][0].append(row)
+                hits[source][1].append(source_row)
+
+        return {source: (np.array(rows), np.array(source_rows)) for source, (rows, source_rows) in hits.items()}
+
+
+class FeatureStore:
+    def __init__(
+        self,
+        path: str,  # path to a `.npy` feature file or a chunked store directory
+        file_names_path: str | None = None,  # path to the `file_names.txt` file giving the row order. Defaults to the one in the same folder.
+    ):
+        """
+        Read-only view of an extracted feature matrix that is memory-mapped,
+        so only the rows that are gathered are read from disk.
+
+        Also keeps a hash index from image paths to rows.
+        """
+        self.path = path
+        if file_names_path is None:
+            file_names_path = join(dirname(path.rstrip(os.sep)), "file_names.txt")
+        self.file_names_path = file_names_path
+        self.file_names = read_file_names(file_names_path)
+        self.index = {file_name: row for row, file_name in enumerate(self.file_names)}
+        self.row_order_hash = row_order_hash(self.file_names)
+
+        self.features = open_features(path, row_order_hash=self.row_order_hash)
+
+    @property
+    def shape(self) -> tuple:
+        return self.features.shape
+
+    def rows(
+        self,
+        file_names: Sequence[str],  # image paths
+    ) -> np.ndarray:  # row of each image
+        """
+        Look up the rows of the given images.
+        """
+        return np.fromiter((self.index[file_name] for file_name in file_names), dtype=np.intp, count=len(file_names))
+
+    def gather(
+        self,
+        file_names: Sequence[str] | np.ndarray,  # image paths, or rows
+    ) -> np.ndarray:  # images x features
+        """
+        Read the features of the given images into memory.
+        """
+        rows = np.asarray(file_names)
+        if rows.dtype.kind not in "iu":
+            rows = self.rows(file_names)
+
+        return np.asarray(self.features[rows])
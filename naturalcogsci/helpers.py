@@ -2,6 +2,8 @@ from __future__ import annotations
 
 __all__ = [
     "get_project_root",
+    "load_feature_store",
+    "load_trial_design",
     "prepare_training",
     "str2bool",
     "id_generator",
@@ -15,12 +17,16 @@ import argparse
 import string
 import glob
 import os
+from functools import lru_cache
 from os.path import join
 from typing import Tuple
 
 import numpy as np
 import pandas as pd
 
+from .feature_store import FeatureStore, read_file_names, row_order_hash
+from .trial_design import TrialDesign
+
 def get_project_root() -> str:  # project root
     """
     Return project root based on device.
@@ -34,67 +40,96 @@ def get_project_root() -> str:  # project root
     return os.getenv("NATURALCOGSCI_ROOT")
 
 
-def prepare_training(task: str, features: str, cond_file: int) -> Tuple[np.ndarray, np.ndarray]:
+@lru_cache(maxsize=None)
+def load_feature_store(features: str) -> FeatureStore:  # memory-mapped features
     """
-    Prepares the observations and the target values to train models on,
-    for the given condition file and the given task. The returned arrays
-    have the shapes shown in the tables below.
+    Open the saved features of the THINGS images once per process.
 
     Args:
-        task (str): 'reward_learning' or 'category_learning'
-        features (str): which embedding to use. must match the saved .txt files
-        cond_file (int): number of the condtion file to prepare arrays for
+        features (str): which embedding to use. must match a saved .npy file or chunked store
 
     Returns:
-        Tuple[np.ndarray, np.ndarray]: X,y arrays
+        FeatureStore: memory-mapped features with an image path to row index
     """
+    project_root = get_project_root()
+    path = join(project_root, "data", "features", f"{features}.npy")
+    if not os.path.exists(path):
+        # chunked store written by `extract_features`
+        path = join(project_root, "data", "features", features)
+    return FeatureStore(path)
 
-    tasks = ["reward_learning", "category_learning"]
-    assert task in tasks, f"{task} must be one of {tasks}"
 
+@lru_cache(maxsize=None)
+def _read_above_chance(task: str) -> pd.DataFrame:
     project_root = get_project_root()
+    return pd.read_csv(join(project_root, "data", "human_behavioural", task, "above_chance.csv"))
 
-    df = pd.read_csv(join(project_root, "data", "human_behavioural", task, "above_chance.csv"))
-    df = df[df.cond_file == cond_file].reset_index(drop=True)
 
-    with open(join(project_root, "data", "features", "file_names.txt"), "r") as f:
-        file_names = f.read()
+@lru_cache(maxsize=None)
+def load_trial_design(task: str, file_names_path: str | None = None) -> TrialDesign:
+    """
+    Load the compiled trial design of a task, which is built from `above_chance.csv`
+    and saved next to it the first time, or whenever the data or the row order of the features changes.
 
-    file_names = file_names.split("\n")[:-1]
-    file_names = [file_name.split("naturalcogsci/")[1] for file_name in file_names]
-    embedding = np.load(join(project_root, "data", "features", f"{features}.npy"))
-    if task == "reward_learning":
-        TRIALS = 60
-        OPTIONS = 2
+    Args:
+        task (str): 'reward_learning' or 'category_learning'
+        file_names_path (str | None): `file_names.txt` giving the feature rows. Defaults to the one in `data/features`, in which case the design is saved.
 
-        left_stimuli = df.left_image.to_list()
-        right_stimuli = df.right_image.to_list()
+    Returns:
+        TrialDesign: feature rows and targets of every condition file
+    """
+    project_root = get_project_root()
+    design_path = join(project_root, "data", "human_behavioural", task, "trial_design.npz")
+    save = file_names_path is None
+    if save:
+        file_names_path = join(project_root, "data", "features", "file_names.txt")
+
+    file_names = read_file_names(file_names_path)
+    file_names_hash = row_order_hash(file_names)
+    # the behavioural data is identified by its size and modification time, so it is not read if unchanged
+    stat = os.stat(join(project_root, "data", "human_behavioural", task, "above_chance.csv"))
+    source = f"{stat.st_size}|{stat.st_mtime_ns}"
+    if save and os.path.exists(design_path):
+        design = TrialDesign.load(design_path)
+        if design.row_order_hash == file_names_hash and design.source == source:
+            return design
+
+    index = {file_name: row for row, file_name in enumerate(file_names)}
+    design = TrialDesign.build(task, _read_above_chance(task), index, file_names_hash, source)
+    if save:
+        design.save(design_path)
+    return design
 
-        left_stimuli = [
-            file_names.index(left_stimulus) for left_stimulus in left_stimuli
-        ]
-        right_stimuli = [
-            file_names.index(right_stimulus) for right_stimulus in right_stimuli
-        ]
 
-        X = np.zeros((TRIALS, OPTIONS, embedding.shape[1]))
-        X[:, 0, :] = embedding[left_stimuli, :]
-        X[:, 1, :] = embedding[right_stimuli, :]
+def prepare_training(task: str, features: str, cond_file: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Prepares the observations and the target values to train models on,
+    for the given condition file and the given task. The returned arrays
+    have the shapes shown in the tables below.
 
-        y = np.zeros((TRIALS, OPTIONS))
-        y[:, 0] = df.left_reward.to_list()
-        y[:, 1] = df.right_reward.to_list()
+    The feature file and the trial design are only read once per process,
+    so this is a single gather of the feature rows. See `load_trial_design`.
 
-    elif task == "category_learning":
-        TRIALS = 120
+    Args:
+        task (str): 'reward_learning' or 'category_learning'
+        features (str): which embedding to use. must match the saved .npy files
+        cond_file (int): number of the condtion file to prepare arrays for
 
-        stimuli = df.image.to_list()[:TRIALS]
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: X,y arrays
+    """
+
+    tasks = ["reward_learning", "category_learning"]
+    assert task in tasks, f"{task} must be one of {tasks}"
 
-        stimuli = [file_names.index(stimulus) for stimulus in stimuli]
+    store = load_feature_store(features)
+    design = load_trial_design(task)
+    if design.row_order_hash != store.row_order_hash:
+        design = load_trial_design(task, store.file_names_path)
 
-        X = np.zeros((TRIALS, embedding.shape[1]))
-        X[:] = embedding[stimuli, :]
-        y = df.true_category_binary.to_numpy()[:TRIALS]
+    rows, targets = design[cond_file]
+    X = store.gather(rows.reshape(-1)).reshape(*rows.shape, -1).astype(np.float64)
+    y = targets.astype(np.float64) if task == "reward_learning" else targets
 
     return X, y
 
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+
+__all__ = ["ImageCache", "CachedImageDataset", "build_image_cache", "decode_params", "load_image"]
+
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import Sequence
+
+import numpy as np
+from PIL import Image
+
+from .feature_store import is_complete, read_file_names, row_order_hash, _dump_json
+
+
+# how images are decoded, saved with the cache as they change what the models see
+DECODE_MODE = "RGB"
+DECODE_RESAMPLE = "bicubic"
+
+
+def decode_params(
+    size: int,  # side length of the square output
+) -> dict:  # everything `load_image` does to an image
+    return {"size": size, "mode": DECODE_MODE, "resample": DECODE_RESAMPLE}
+
+
+def load_image(
+    path: str,  # image file
+    size: int,  # side length of the square output
+) -> np.ndarray:  # size x size x 3 uint8 array
+    """
+    Decode an image and resize it the same way as the pixel PCA baseline.
+    Images that already have the given size are not resampled.
+    """
+    image = Image.open(path).convert(DECODE_MODE)
+    return np.asarray(image.resize((size, size), resample=Image.BICUBIC))
+
+
+def build_image_cache(
+    file_paths: Sequence[str],  # image files in the order of the cache rows
+    path: str,  # directory of the cache
+    size: int = 224,  # side length the images are resized to
+    n_jobs: int = 1,  # number of threads decoding images
+    chunk_size: int = 256,  # number of images decoded between writes
+) -> ImageCache:
+    """
+    Decode and resize all images once, and save them as a memory-mapped uint8 array
+    with the image paths as its index.
+    """
+    os.makedirs(path, exist_ok=True)
+    images = np.lib.format.open_memmap(
+        join(path, "images.npy"), mode="w+", dtype=np.uint8, shape=(len(file_paths), size, size, 3)
+    )
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for start in range(0, len(file_paths), chunk_size):
+            chunk = file_paths[start : start + chunk_size]
+            images[start : start + len(chunk)] = np.stack(list(pool.map(lambda x: load_image(x, size), chunk)))
+
+    images.flush()
+    del images
+
+    with open(join(path, "file_names.txt"), "w") as f:
+        f.write("".join(f"{file_path}\n" for file_path in file_paths))
+
+    # written last, so an interrupted cache is never used
+    _dump_json(
+        join(path, "metadata.json"),
+        {**decode_params(size), "n_images": len(file_paths), "row_order_hash": row_order_hash(file_paths)},
+    )
+
+    return ImageCache(path)
+
+
+class ImageCache:
+    def __init__(
+        self,
+        path: str,  # directory of the cache
+    ):
+        """
+        Read-only view of decoded images saved by `build_image_cache`.
+        """
+        self.path = path
+        with open(join(path, "metadata.json")) as f:
+            self.metadata = json.load(f)
+
+        self.images = np.load(join(path, "images.npy"), mmap_mode="r")
+        self.file_names = read_file_names(join(path, "file_names.txt"), prefix=None)
+        self.index = {file_name: row for row, file_name in enumerate(self.file_names)}
+
+    @classmethod
+    def load(
+        cls,
+        path: str,  # directory of the cache
+        file_paths: Sequence[str],  # image files in the order of the cache rows
+        size: int = 224,  # side length the images are resized to
+        n_jobs: int = 1,  # number of threads decoding images, if the cache is built
+    ) -> ImageCache:
+        """
+        Open the cache if it holds the given images at the given size, and build it otherwise.
+        """
+        if is_complete(path):
+            cache = cls(path)
+            if cache.decode_params == decode_params(size) and cache.metadata["row_order_hash"] == row_order_hash(
+                file_paths
+            ):
+                return cache
+
+        return build_image_cache(file_paths, path, size=size, n_jobs=n_jobs)
+
+    @property
+    def decode_params(self) -> dict:
+        """
+        How the cached images were decoded, see `decode_params`.
+        """
+        return {key: self.metadata.get(key) for key in decode_params(0)}
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        return np.asarray(self.images[row])
+
+
+class CachedImageDataset:
+    def __init__(
+        self,
+        cache: ImageCache,  # decoded images
+        transforms=None,  # callable applied to each PIL image, e.g. `extractor.get_transformations()`
+    ):
+        """
+        Map-style dataset over cached images that can replace thingsvision's `ImageDataset`
+        in a PyTorch `DataLoader`, without decoding the JPEG files again.
+        """
+        self.cache = cache
+        self.transforms = transforms
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __getitem__(self, row: int):
+        image = Image.fromarray(self.cache[row])
+        if self.transforms is not None:
+            image = self.transforms(image)
+        return image
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+
+__all__ = [
+    "preprocess_features",
+    "two_nearest_neighbours",
+    "twonn",
+    "estimate_intrinsic_dimension",
+    "intrinsic_dimension_table",
+]
+
+
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.preprocessing import MinMaxScaler
+
+from .feature_store import feature_name, open_features
+
+
+def preprocess_features(
+    X: np.ndarray,  # observations by features
+) -> np.ndarray:  # unique observations, scaled to [0, 1] per feature
+    """
+    Remove duplicate observations, which have a nearest neighbour distance of 0, and min-max scale the features.
+    """
+    X = np.unique(np.asarray(X), axis=0)
+    return MinMaxScaler().fit_transform(X)
+
+
+def two_nearest_neighbours(
+    X: np.ndarray,  # observations by features, without duplicates
+    block_size: int = 2048,  # number of query observations per distance block
+) -> np.ndarray:  # observations by 2 array of the distances to the first and second nearest neighbours
+    """
+    Exact nearest neighbour distances from blocks of squared distances, $\\|a\\|^2 + \\|b\\|^2 - 2 a^T b$,
+    so that most of the work is a matrix product.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    squared_norms = (X**2).sum(axis=1)
+    distances = np.empty((len(X), 2))
+    for start in range(0, len(X), block_size):
+        block = X[start : start + block_size]
+        rows = np.arange(len(block))
+        block_distances = squared_norms[start : start + block_size, None] + squared_norms[None] - 2 * block @ X.T
+        # exclude each observation from its own neighbours
+        block_distances[rows, rows + start] = np.inf
+        nearest = np.partition(block_distances, 1, axis=1)[:, :2]
+        distances[start : start + block_size] = np.sqrt(np.maximum(nearest, 0))
+
+    return distances
+
+
+def twonn(
+    distances: np.ndarray,  # observations by 2 array of the nearest neighbour distances
+    discard_fraction: float = 0.1,  # fraction of the largest distance ratios to discard
+) -> float:  # intrinsic dimension
+    """
+    TwoNN estimator of [Facco et al. (2017)](https://www.nature.com/articles/s41598-017-11873-y),
+    fitted the same way as `skdim.id.TwoNN`.
+    """
+    mu = np.sort(distances[:, 1] / distances[:, 0])
+    n = len(mu)
+    empirical_cdf = np.arange(n) / n
+    n_kept = int(n * (1 - discard_fraction))
+
+    x = np.log(mu[:n_kept])
+    y = -np.log(1 - empirical_cdf[:n_kept])
+    # least squares line through the origin
+    return (x @ y) / (x @ x)
+
+
+def estimate_intrinsic_dimension(
+    X: np.ndarray,  # observations by features, preprocessed with `preprocess_features`
+    n_projections: int | None = None,  # if given and smaller than the number of features, estimate on this many Gaussian random projections
+    n_resamples: int = 0,  # number of bootstrap or subsample estimates for the confidence interval
+    resampling: str = "bootstrap",  # 'bootstrap' resamples the distance ratios, 'subsample' reruns the estimate on subsets of the observations
+    subsample_fraction: float = 0.5,  # fraction of the observations in each subsample
+    confidence: float = 0.95,  # level of the confidence interval
+    discard_fraction: float = 0.1,  # see `twonn`
+    block_size: int = 2048,  # see `two_nearest_neighbours`
+    random_state: int | None = 0,  # seed of the projections and resamples
+) -> dict:  # intrinsic dimension, and the bounds of its confidence interval if `n_resamples` > 0
+    """
+    Estimate the intrinsic dimension with TwoNN, optionally with a resampling confidence interval.
+    """
+    resamplings = ["bootstrap", "subsample"]
+    assert resampling in resamplings, f"{resampling} must be one of {resamplings}"
+    rng = np.random.default_rng(random_state)
+
+    X = np.asarray(X, dtype=np.float64)
+    if n_projections is not None and n_projections < X.shape[1]:
+        # Johnson-Lindenstrauss projection, which approximately preserves the distances
+        X = X @ (rng.standard_normal((X.shape[1], n_projections)) / np.sqrt(n_projections))
+
+    distances = two_nearest_neighbours(X, block_size=block_size)
+    result = {"local ID": twonn(distances, discard_fraction=discard_fraction)}
+    if n_resamples == 0:
+        return result
+
+    estimates = []
+    for _ in range(n_resamples):
+        if resampling == "bootstrap":
+            resample = rng.integers(0, len(distances), len(distances))
+            estimates.append(twonn(distances[resample], discard_fraction=discard_fraction))
+        else:
+            subsample = rng.choice(len(X), int(len(X) * subsample_fraction), replace=False)
+            subsample_distances = two_nearest_neighbours(X[subsample], block_size=block_size)
+            estimates.append(twonn(subsample_distances, discard_fraction=discard_fraction))
+
+    alpha = (1 - confidence) / 2
+    result["ci low"], result["ci high"] = np.quantile(estimates, [alpha, 1 - alpha])
+    return result
+
+
+def _feature_file_dimension(feature_file: str, **kwargs) -> dict:
+    X = preprocess_features(open_features(feature_file))
+    return {
+        "Feature": feature_name(feature_file),
+        **estimate_intrinsic_dimension(X, **kwargs),
+    }
+
+
+def intrinsic_dimension_table(
+    feature_files: Sequence[str],  # `.npy` files or chunked stores of observations by features
+    n_jobs: int | None = None,  # number of processes, see `joblib.Parallel`
+    **kwargs,  # passed to `estimate_intrinsic_dimension`
+) -> pd.DataFrame:  # one row per feature file
+    """
+    Estimate the intrinsic dimension of many feature files in parallel processes.
+    """
+    rows = Parallel(n_jobs=n_jobs)(
+        delayed(_feature_file_dimension)(feature_file, **kwargs) for feature_file in feature_files
+    )
+    return pd.DataFrame(rows)
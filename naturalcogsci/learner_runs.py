@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+
+__all__ = [
+    "fit_regulariser",
+    "category_values",
+    "condition_values",
+    "learner_behaviour",
+    "run_sweep",
+    "REGULARISATION_COEFS",
+    "REGULARISATION_SEARCHES",
+]
+
+
+import os
+from os.path import join
+from typing import Iterator, Sequence
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import clone
+from sklearn.decomposition import PCA
+from sklearn.linear_model import ARDRegression, BayesianRidge, LogisticRegression
+
+from .helpers import get_project_root, prepare_training
+from .learners import CategoryLearner, RewardLearner, regularisation_path
+
+
+# inverse regularisation strengths searched for the category learners
+REGULARISATION_COEFS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 1.5, 2, 3, 4, 5, 10, 15, 20]
+REGULARISATION_SEARCHES = ["sequential", "path"]
+
+N_FEATURES = 49  # this is the number of features in the task
+N_TRIALS = 60
+N_OPTIONS = 2
+
+
+def fit_regulariser(
+    penalty_type: str,  # penalty of the logistic regression
+    X: np.ndarray,  # trials by features, standardised in place by the 'sequential' search
+    y: np.ndarray,  # categories
+    search: str = "sequential",  # 'sequential' or 'path', see below
+) -> tuple[float, LogisticRegression]:  # inverse regularisation strength with the best training accuracy, and the estimator fitted with it
+    """
+    Select the regularisation strength of the category learner by its training accuracy.
+
+    The 'sequential' search fits the learner over all trials for each strength and scores its last fit,
+    as the published results did. Like `CategoryLearner.fit`, this standardises `X` in place,
+    so later fits on `X` see the same observations as they did then.
+    The 'path' search fits each strength once, see `naturalcogsci.learners.regularisation_path`.
+    It is much faster, but may select a different strength.
+    """
+    assert search in REGULARISATION_SEARCHES, f"{search} must be one of {REGULARISATION_SEARCHES}"
+    estimator = LogisticRegression(penalty=penalty_type, max_iter=5000, solver="liblinear")
+    if search == "path":
+        _, best_alpha, best_estimator = regularisation_path(X, y, REGULARISATION_COEFS, estimator)
+        return best_alpha, best_estimator
+
+    best_score = 0
+    best_alpha, best_estimator = 1, None
+    for alpha in REGULARISATION_COEFS:
+        category_learner = CategoryLearner(clone(estimator).set_params(C=alpha))
+        category_learner.fit(X, y)
+        score = category_learner.estimator.score(X, y)
+        if score > best_score:
+            best_score = score
+            best_alpha, best_estimator = alpha, category_learner.estimator
+
+    return best_alpha, best_estimator
+
+
+def _reward_values(
+    features: str,  # which embedding to use
+    cond_files: Sequence,  # condition files fitted together
+    transform: str,  # 'original' or 'pca'
+    regularisation: str,  # 'l2' for `BayesianRidge`, otherwise `ARDRegression`
+) -> np.ndarray:  # condition files by trials by options values
+    Xs, ys = [], []
+    for cond_file in cond_files:
+        X, y = prepare_training("reward_learning", features, cond_file)
+        if transform == "pca":
+            X = X.reshape(N_TRIALS * N_OPTIONS, -1)
+            X = PCA(n_components=N_FEATURES).fit_transform(X)
+            X = X.reshape(N_TRIALS, N_OPTIONS, -1)
+        Xs.append(X)
+        ys.append(y)
+
+    estimator = BayesianRidge() if regularisation == "l2" else ARDRegression()
+    learner = RewardLearner(estimator=estimator, incremental=True)
+    learner.fit_batch(np.stack(Xs), np.stack(ys), groups=list(cond_files))
+    return learner.values
+
+
+def category_values(
+    X: np.ndarray,  # trials by features
+    y: np.ndarray,  # categories
+    transform: str = "original",  # 'original' or 'pca'
+    regularisation: str = "l2",  # penalty of the logistic regression
+    search: str = "sequential",  # search of the regularisation strength, see `fit_regulariser`
+    warm_start: bool = False,  # use the warm-started trial loop of `CategoryLearner` instead of refitting liblinear from scratch
+) -> np.ndarray:  # trials by options values
+    """
+    Trial-wise values of the category learner of one condition file.
+
+    By default, the learner is refit from scratch on every trial, as for the published results.
+    `warm_start` carries the coefficients over between trials, with Newton's method for 'l2',
+    which is faster but scales the observations differently, so its values differ.
+    """
+    penalty_coef, _ = fit_regulariser(regularisation, X, y, search)
+    estimator = LogisticRegression(
+        penalty=regularisation,
+        C=penalty_coef,
+        max_iter=5000,
+        solver="liblinear",
+    )
+    if warm_start:
+        learner = CategoryLearner(estimator, warm_start=True, solver="newton" if regularisation == "l2" else "sklearn")
+    else:
+        learner = CategoryLearner(estimator)
+
+    X = PCA(n_components=N_FEATURES).fit_transform(X) if transform == "pca" else X
+
+    learner.fit(X, y)
+    return learner.values
+
+
+def _category_values(
+    features: str,  # which embedding to use
+    cond_file,  # condition file
+    transform: str,  # 'original' or 'pca'
+    regularisation: str,  # penalty of the logistic regression
+    search: str = "sequential",  # search of the regularisation strength, see `fit_regulariser`
+    warm_start: bool = False,  # see `category_values`
+) -> np.ndarray:  # trials by options values
+    X, y = prepare_training("category_learning", features, cond_file)
+    return category_values(X, y, transform, regularisation, search, warm_start)
+
+
+def condition_values(
+    experiment: str,  # 'reward_learning' or 'category_learning'
+    features: str,  # which embedding to use
+    cond_files: Sequence,  # unique condition files
+    transform: str = "original",  # 'original' or 'pca'
+    regularisation: str = "l2",  # regularisation of the learners
+    n_jobs: int | None = None,  # number of processes, see `joblib.Parallel`
+    parallel: Parallel | None = None,  # running `joblib.Parallel` to reuse instead of starting one with `n_jobs`
+    search: str = "sequential",  # search of the regularisation strength of the category learners, see `fit_regulariser`
+    warm_start: bool = False,  # warm-start the category learners, see `category_values`
+) -> dict:  # condition file -> trials by options values
+    """
+    Fit the learners of every condition file, spread over processes.
+
+    Each process memory-maps the features once (see `helpers.load_feature_store`),
+    and only the small value arrays are sent back.
+    Reward learners of a process are fitted together in one batch.
+    """
+    parallel = parallel or Parallel(n_jobs=n_jobs)
+    cond_files = list(cond_files)
+    if experiment == "reward_learning":
+        n_chunks = min(effective_n_jobs(parallel.n_jobs), len(cond_files))
+        chunks = [list(chunk) for chunk in np.array_split(np.array(cond_files, dtype=object), n_chunks)]
+        values = parallel(
+            delayed(_reward_values)(features, chunk, transform, regularisation) for chunk in chunks
+        )
+        values = [cond_values for chunk_values in values for cond_values in chunk_values]
+    else:
+        values = parallel(
+            delayed(_category_values)(features, cond_file, transform, regularisation, search, warm_start)
+            for cond_file in cond_files
+        )
+
+    return dict(zip(cond_files, values))
+
+
+def learner_behaviour(
+    df: pd.DataFrame,  # behavioural data with `participant` and `cond_file` columns
+    cond_values: dict,  # condition file -> trials by options values, see `condition_values`
+    features: str,  # which embedding was used
+    transform: str,  # 'original' or 'pca'
+    regularisation: str,  # regularisation of the learners
+) -> pd.DataFrame:  # rows of each participant, in order of appearance, with the values of their learner
+    """
+    Attach the values of the learners to the trials of the participants who saw their condition file.
+    """
+    rows = list(df.groupby("participant", sort=False).indices.values())
+    cond_files = [df["cond_file"].iloc[participant_rows[0]] for participant_rows in rows]
+    values = np.concatenate([cond_values[cond_file] for cond_file in cond_files])
+
+    model_df = df.iloc[np.concatenate(rows)].reset_index(drop=True)
+    model_df["left_value"] = values[:, 0]
+    model_df["right_value"] = values[:, 1]
+    model_df["features"] = features
+    model_df["transform"] = transform
+    model_df["penalty"] = regularisation
+    return model_df
+
+
+def run_sweep(
+    features: Sequence[str],  # embeddings to fit learners on
+    experiments: Sequence[str] = ("reward_learning", "category_learning"),  # tasks to fit learners of
+    transform: str = "original",  # 'original' or 'pca'
+    regularisation: str = "l2",  # regularisation of the learners
+    n_jobs: int | None = None,  # number of processes, see `joblib.Parallel`
+    overwrite: bool = False,  # refit models whose output already exists
+    search: str = "sequential",  # search of the regularisation strength of the category learners, see `fit_regulariser`
+    warm_start: bool = False,  # warm-start the category learners, see `category_values`
+) -> Iterator[str]:  # output file of each model, as soon as it is written
+    """
+    Fit and save the learners of many embeddings and tasks in one process.
+
+    The behavioural data and condition files of each task are parsed once, and the same worker
+    processes, which keep their parsed data and memory-mapped features between models, are used throughout.
+    """
+    project_root = get_project_root()
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for experiment in experiments:
+            df = pd.read_csv(join(project_root, "data", "human_behavioural", experiment, "above_chance.csv"))
+            # participants with the same condition file have the same model fits
+            cond_files = list(dict.fromkeys(df.drop_duplicates("participant")["cond_file"]))
+
+            for feature in features:
+                feature = feature.replace("/", "_")
+                save_file_name = join(
+                    project_root, "data", "learner_behavioural", experiment, f"{feature}_{regularisation}_{transform}.csv"
+                )
+                if os.path.isfile(save_file_name) and not overwrite:
+                    continue
+
+                cond_values = condition_values(
+                    experiment,
+                    feature,
+                    cond_files,
+                    transform,
+                    regularisation,
+                    parallel=parallel,
+                    search=search,
+                    warm_start=warm_start,
+                )
+                learner_behaviour(df, cond_values, feature, transform, regularisation).to_csv(
+                    save_file_name, index=False
+                )
+                yield save_file_name
@@ -4,10 +4,17 @@ from __future__ import annotations
 __all__ = [
     "CategoryLearner",
     "RewardLearner",
+    "IncrementalBayesianRidge",
+    "fit_logistic_newton",
+    "regularisation_path",
 ]
 
 
+import hashlib
+
 import numpy as np
+from joblib import Parallel, delayed
+from scipy.special import expit
 from sklearn.linear_model import BayesianRidge, LogisticRegression
 from sklearn.base import clone
 
@@ -18,12 +25,23 @@ class CategoryLearner:
         estimator=LogisticRegression(
             max_iter=4000
         ),  # Linear model to be used for the task. Defaults to `sklearn.linear_model.LogisticRegression`.
+        warm_start: bool = False,  # Carry the coefficients over from one trial to the next and keep running scaling statistics.
+        solver: str = "sklearn",  # 'sklearn' to fit the estimator itself or 'newton' to fit its L2 objective with `fit_logistic_newton`.
     ):
         """
         A class of agent that is used to model the category-learning learning task
         using a linear model of choosing.
+
+        With `warm_start` or the 'newton' solver, observations are scaled with the running
+        mean and standard deviation of the raw observations seen so far, and `X` is not
+        modified in place.
         """
+        solvers = ["sklearn", "newton"]
+        assert solver in solvers, f"{solver} must be one of {solvers}"
+
         self.estimator = estimator
+        self.warm_start = warm_start
+        self.solver = solver
         # below are place holders
         self.X = np.zeros(1)
         self.y = np.zeros(1)
@@ -85,6 +103,10 @@ class CategoryLearner:
         self.y = y
         self.values = np.zeros((self.X.shape[0], 2))
 
+        if self.warm_start or self.solver == "newton":
+            self._fit_running()
+            return
+
         # give pseudo-observations so the model can make predictions
         self.estimator.fit(np.zeros((2, self.X.shape[1])), np.array([0, 1]))
 
@@ -92,11 +114,273 @@ class CategoryLearner:
             self._predict(trial)
             self._learn(trial)
 
+    def _fit_running(self):
+        """
+        Same as `fit`, but without refitting a cold estimator on every trial.
+
+        The scaling parameters are updated with one observation per trial, and
+        the coefficients of the previous trial are the starting point of the next fit.
+        """
+        n_trials, n_features = self.X.shape
+        estimator = clone(self.estimator)
+
+        if self.solver == "sklearn":
+            # liblinear ignores warm_start, the other solvers start from coef_
+            estimator.set_params(warm_start=self.warm_start)
+            estimator.fit(np.zeros((2, n_features)), np.array([0, 1]))
+        else:
+            # the pseudo-observations give all zero coefficients
+            estimator.coef_ = np.zeros((1, n_features))
+            estimator.intercept_ = np.zeros(1)
+            estimator.classes_ = np.array([0, 1])
+            estimator.n_features_in_ = n_features
+
+        self.mean = 0
+        self.std = 1
+        mean = np.zeros(n_features)
+        m2 = np.zeros(n_features)
+
+        for trial in range(n_trials):
+            X_test = ((self.X[trial] - self.mean) / self.std).reshape(1, -1)
+            if self.solver == "sklearn":
+                self.values[trial, :] = estimator.predict_proba(X_test)
+            else:
+                p = expit(X_test @ estimator.coef_[0] + estimator.intercept_[0])[0]
+                self.values[trial, :] = [1 - p, p]
+
+            # Welford update of the scaling parameters
+            delta = self.X[trial] - mean
+            mean = mean + delta / (trial + 1)
+            m2 = m2 + delta * (self.X[trial] - mean)
+
+            if not (0 in self.y[: trial + 1] and 1 in self.y[: trial + 1]):
+                continue
+
+            self.mean = mean
+            self.std = np.sqrt(m2 / (trial + 1))
+            self.std = np.where(self.std == 0, 1, self.std)
+            train_X = (self.X[: trial + 1] - self.mean) / self.std
+
+            if self.solver == "sklearn":
+                if not self.warm_start:
+                    estimator = clone(estimator)
+                estimator.fit(train_X, self.y[: trial + 1])
+            else:
+                coef, intercept = fit_logistic_newton(
+                    train_X,
+                    self.y[: trial + 1],
+                    estimator,
+                    coef=estimator.coef_[0] if self.warm_start else None,
+                    intercept=estimator.intercept_[0] if self.warm_start else 0.0,
+                )
+                estimator.coef_ = coef.reshape(1, -1)
+                estimator.intercept_ = np.array([intercept])
+
+        self.estimator = estimator
+
+    def fit_batch(
+        self,
+        X: np.ndarray,  # Observations -> participant x trial x feature
+        y: np.ndarray,  # Category -> participant x trial
+        groups: np.ndarray | None = None,  # Label per participant (e.g. condition file) identifying identical sequences. Defaults to hashing X and y.
+    ):
+        """
+        Fit the model to the task sequences of several participants.
+
+        Each unique sequence is only fit once, and the results are shared by all
+        participants with the same sequence. `values` is then participant x trial x option.
+        """
+        unique_indices, inverse = _unique_sequences(X, y, groups)
+
+        values = np.zeros((len(unique_indices), X.shape[1], 2))
+        for i, index in enumerate(unique_indices):
+            learner = CategoryLearner(clone(self.estimator), warm_start=self.warm_start, solver=self.solver)
+            learner.fit(X[index].copy(), y[index])
+            values[i] = learner.values
+
+        self.X, self.y = X, y
+        self.values = values[inverse]
+
+
+def regularisation_path(
+    X: np.ndarray,  # Observations -> trial x feature
+    y: np.ndarray,  # Category -> trial
+    Cs: list,  # Inverse regularisation strengths to evaluate.
+    estimator: LogisticRegression = LogisticRegression(
+        penalty="l2", max_iter=5000, solver="liblinear"
+    ),  # Estimator whose `C` is swept. Its other hyperparameters are kept.
+    n_jobs: int | None = None,  # Evaluate the candidates in parallel with this many jobs instead of along a warm-started path.
+) -> tuple[np.ndarray, float, LogisticRegression]:  # training accuracy for each C, the best C, and the estimator fitted with it
+    """
+    Select the regularisation strength of a `CategoryLearner` by its training accuracy.
+
+    Only the fit on all trials determines the training accuracy, so each candidate is
+    fit once on the standardised observations rather than sequentially over trials.
+    With the 'l2' penalty, the candidates are fit with `fit_logistic_newton` in increasing
+    order of C, each starting from the solution of the previous one. Otherwise the estimator
+    itself is fit for each C. Ties go to the C that comes first in `Cs`.
+
+    This is not the selection rule of the sequential search in `naturalcogsci.learner_runs.fit_regulariser`,
+    which scores the last fit of the learner on observations it standardised in place,
+    so the two can pick different strengths.
+    """
+    std = X.std(axis=0)
+    X = (X - X.mean(axis=0)) / np.where(std == 0, 1, std)
+
+    def _score(C, coef=None, intercept=0.0):
+        candidate = clone(estimator).set_params(C=C)
+        if _is_l2(estimator):
+            coef, intercept = fit_logistic_newton(X, y, candidate, coef=coef, intercept=intercept)
+        else:
+            candidate.fit(X, y)
+            coef, intercept = candidate.coef_[0], candidate.intercept_[0]
+        accuracy = np.mean(((X @ coef + intercept) > 0) == y)
+        return accuracy, coef, intercept
+
+    if n_jobs is not None:
+        results = Parallel(n_jobs=n_jobs)(delayed(_score)(C) for C in Cs)
+    else:
+        results = [None] * len(Cs)
+        coef, intercept = None, 0.0
+        for i in np.argsort(Cs, kind="stable"):
+            results[i] = _score(Cs[i], coef, intercept)
+            _, coef, intercept = results[i]
+
+    scores = np.array([accuracy for accuracy, _, _ in results])
+    best = int(np.argmax(scores))
+
+    # the coefficients of the best C on the standardised observations, so that it does not have to be fit again
+    best_estimator = clone(estimator).set_params(C=Cs[best])
+    best_estimator.coef_ = np.asarray(results[best][1]).reshape(1, -1)
+    best_estimator.intercept_ = np.array([results[best][2]])
+    best_estimator.classes_ = np.array([0, 1])
+    best_estimator.n_features_in_ = X.shape[1]
+
+    return scores, Cs[best], best_estimator
+
+
+def _unique_sequences(
+    X: np.ndarray,  # Observations -> participant x ...
+    y: np.ndarray,  # Targets -> participant x ...
+    groups: np.ndarray | None = None,  # Label per participant identifying identical sequences.
+) -> tuple[np.ndarray, np.ndarray]:  # index of the first participant of each unique sequence, and the unique sequence of each participant
+    """
+    Find the participants that were shown identical task sequences.
+    """
+    if groups is None:
+        groups = [
+            hashlib.sha1(np.ascontiguousarray(X[i]).tobytes() + np.ascontiguousarray(y[i]).tobytes()).hexdigest()
+            for i in range(len(X))
+        ]
+    _, unique_indices, inverse = np.unique(np.asarray(groups), return_index=True, return_inverse=True)
+
+    return unique_indices, inverse.ravel()
+
+
+def _is_l2(
+    estimator: LogisticRegression,  # Estimator to check
+) -> bool:
+    # newer sklearn versions default `penalty` to 'deprecated' and set the mix with `l1_ratio` instead
+    l1_ratio = getattr(estimator, "l1_ratio", None)
+    return estimator.penalty in ("l2", "deprecated") and (l1_ratio is None or l1_ratio == 0)
+
+
+def fit_logistic_newton(
+    X: np.ndarray,  # Observations -> sample x feature
+    y: np.ndarray,  # Binary labels -> sample
+    estimator: LogisticRegression,  # Estimator whose L2 objective is minimised. Only its hyperparameters are used.
+    coef: np.ndarray | None = None,  # Starting coefficients. Defaults to 0s.
+    intercept: float = 0.0,  # Starting intercept.
+    max_iter: int = 100,  # Maximum number of Newton steps.
+) -> tuple[np.ndarray, float]:  # coefficients and intercept
+    """
+    Minimise the L2-penalised logistic loss of a `LogisticRegression` with Newton's method
+    (equivalently IRLS) directly on NumPy arrays.
+
+    As in sklearn, the intercept is not penalised, except with the 'liblinear' solver,
+    where it is the penalised weight of a constant feature of value `intercept_scaling`.
+
+    The Newton system is solved in feature space if there are more samples than features,
+    and with the Woodbury identity in sample space otherwise.
+    Iterations stop once the largest absolute gradient entry is below `estimator.tol`.
+    """
+    if not _is_l2(estimator):
+        raise ValueError(
+            f"Only the 'l2' penalty is supported, got '{estimator.penalty}' with l1_ratio {estimator.l1_ratio}"
+        )
+
+    n_samples, n_features = X.shape
+    C = estimator.C
+    y = np.asarray(y, dtype=float)
+
+    if not estimator.fit_intercept:
+        scaling, intercept_penalty = 0.0, 0.0
+    elif estimator.solver == "liblinear":
+        scaling, intercept_penalty = estimator.intercept_scaling, 1.0
+    else:
+        scaling, intercept_penalty = 1.0, 0.0
+
+    w = np.zeros(n_features) if coef is None else np.array(coef, dtype=float)
+    b = intercept / scaling if scaling else 0.0
+
+    dual = n_samples <= n_features
+    gram = X @ X.T if dual else None
+
+    def _loss(w, b):
+        z = X @ w + scaling * b
+        return (
+            C * np.sum(np.logaddexp(0, z) - y * z)
+            + 0.5 * w @ w
+            + 0.5 * intercept_penalty * b**2
+        )
+
+    loss = _loss(w, b)
+    for _ in range(max_iter):
+        p = expit(X @ w + scaling * b)
+        residual = C * (p - y)
+        grad_w = X.T @ residual + w
+        grad_b = scaling * residual.sum() + intercept_penalty * b
+
+        if max(np.abs(grad_w).max(), abs(grad_b)) < estimator.tol:
+            break
+
+        curvature = C * p * (1 - p)
+
+        # solve (I + X^T diag(curvature) X) v = rhs for the two right hand sides
+        rhs = np.stack([grad_w, scaling * (X.T @ curvature)], axis=1)
+        if dual:
+            root = np.sqrt(curvature)
+            inner = np.eye(n_samples) + root[:, None] * gram * root[None, :]
+            solved = rhs - X.T @ (root[:, None] * np.linalg.solve(inner, root[:, None] * (X @ rhs)))
+        else:
+            hessian = X.T @ (curvature[:, None] * X) + np.eye(n_features)
+            solved = np.linalg.solve(hessian, rhs)
+
+        # block elimination of the intercept
+        cross = rhs[:, 1]
+        schur = scaling**2 * curvature.sum() + intercept_penalty - cross @ solved[:, 1]
+        step_b = (grad_b - cross @ solved[:, 0]) / schur if schur > 0 else 0.0
+        step_w = solved[:, 0] - step_b * solved[:, 1]
+
+        # backtracking line search
+        step_size = 1.0
+        while step_size > 1e-10:
+            new_loss = _loss(w - step_size * step_w, b - step_size * step_b)
+            if new_loss <= loss:
+                break
+            step_size /= 2
+        w = w - step_size * step_w
+        b = b - step_size * step_b
+        loss = new_loss
+
+    return w, scaling * b
+
 
 class RewardLearner:
     def __init__(
         self,
         estimator=BayesianRidge(),  #  Linear model to be used for the task. Defaults to `sklearn.linear_model.BayesianRidge`.
+        incremental: bool = False,  # Use `IncrementalBayesianRidge` instead of refitting the estimator on every trial. Only used if the estimator is a `BayesianRidge`.
     ):
         """
         A class of agent that is used to model the reward-guided learning task
@@ -104,6 +388,7 @@ class RewardLearner:
 
         """
         self.estimator = estimator
+        self.incremental = incremental
         # below are place holders
         self.X = np.zeros(1)
         self.y = np.zeros(1)
@@ -123,6 +408,10 @@ class RewardLearner:
         self.values = np.zeros([self.X.shape[0], 2])
         self.weights = np.zeros([self.X.shape[0], self.X.shape[2]])
 
+        if self.incremental and type(self.estimator) is BayesianRidge:
+            self._fit_incremental()
+            return
+
         # initialise scaling values
         mean = np.zeros(self.X.shape[2])
         std = np.ones(self.X.shape[2])
@@ -149,6 +438,68 @@ class RewardLearner:
 
             self.weights[trial, :] = self.estimator.coef_
 
+    def fit_batch(
+        self,
+        X: np.ndarray,  # Observations -> participant x trial x option x feature
+        y: np.ndarray,  # Reward -> participant x trial x option
+        groups: np.ndarray | None = None,  # Label per participant (e.g. condition file) identifying identical sequences. Defaults to hashing X and y.
+    ):
+        """
+        Fit the model to the task sequences of several participants.
+
+        Each unique sequence is only fit once. With an incremental `BayesianRidge`, all unique
+        sequences are updated together with stacked linear algebra; otherwise they are fit
+        one after the other. `values` and `weights` then have a leading participant dimension.
+        """
+        unique_indices, inverse = _unique_sequences(X, y, groups)
+        unique_X, unique_y = X[unique_indices], y[unique_indices]
+        n_sequences, n_trials, _, n_features = unique_X.shape
+
+        values = np.zeros((n_sequences, n_trials, 2))
+        weights = np.zeros((n_sequences, n_trials, n_features))
+
+        if self.incremental and type(self.estimator) is BayesianRidge:
+            engine = IncrementalBayesianRidge.from_estimator(
+                self.estimator, n_features, max_samples=n_trials * 2, batch_shape=(n_sequences,)
+            )
+            for trial in range(n_trials):
+                if trial:
+                    values[:, trial, :] = engine.predict(unique_X[:, trial])
+
+                engine.update(unique_X[:, trial], unique_y[:, trial])
+                engine.fit()
+
+                weights[:, trial, :] = engine.coef_
+        else:
+            for i in range(n_sequences):
+                learner = RewardLearner(clone(self.estimator), incremental=self.incremental)
+                learner.fit(unique_X[i].copy(), unique_y[i])
+                values[i], weights[i] = learner.values, learner.weights
+
+        self.X, self.y = X, y
+        self.values = values[inverse]
+        self.weights = weights[inverse]
+
+    def _fit_incremental(self):
+        """
+        Same as `fit`, but the posterior is updated from running statistics
+        with `IncrementalBayesianRidge` rather than refitting the estimator
+        on the growing training set on every trial.
+        """
+        engine = IncrementalBayesianRidge.from_estimator(
+            self.estimator, self.X.shape[2], max_samples=self.X.shape[0] * 2
+        )
+
+        for trial in range(self.X.shape[0]):
+            # predictions are made with the posterior and scaling of the previous trial
+            if trial:
+                self.values[trial, :] = engine.predict(self._get_test_data(trial))
+
+            engine.update(self.X[trial], self.y[trial])
+            engine.fit()
+
+            self.weights[trial, :] = engine.coef_
+
     def _predict(self, test_X: np.ndarray, trial: int):
         """
         Make predictions for the giben observations and save them.
@@ -205,4 +556,253 @@ class RewardLearner:
             [self.y[: trial + 1, 0], self.y[: trial + 1, 1]], axis=0
         )[:, np.newaxis]
 
-        return training_X, training_y
\ No newline at end of file
+        return training_X, training_y
+
+
+class IncrementalBayesianRidge:
+    def __init__(
+        self,
+        n_features: int,  # Number of features of the observations.
+        max_samples: int | None = None,  # Expected number of observations. Used to decide whether to keep the feature scatter matrix.
+        max_iter: int = 300,  # Maximum number of evidence maximisation iterations.
+        tol: float = 1e-3,  # Stop the iterations if the coefficients change less than this.
+        alpha_1: float = 1e-6,  # Shape parameter of the Gamma prior over alpha.
+        alpha_2: float = 1e-6,  # Rate parameter of the Gamma prior over alpha.
+        lambda_1: float = 1e-6,  # Shape parameter of the Gamma prior over lambda.
+        lambda_2: float = 1e-6,  # Rate parameter of the Gamma prior over lambda.
+        alpha_init: float | None = None,  # Initial value of alpha. Defaults to 1 / Var(y).
+        lambda_init: float | None = None,  # Initial value of lambda. Defaults to 1.
+        batch_shape: tuple = (),  # Leading dimensions of independent regression problems that are updated together.
+    ):
+        """
+        Bayesian ridge regression on standardised observations that is updated
+        one batch of observations at a time.
+
+        Keeps the running mean and variance of the observations (Welford/Chan updates),
+        the centred scatter matrix $X^TX$ and $X^Ty$ as well as the raw observations.
+        Every call to `fit` then gives the same posterior as fitting
+        `sklearn.linear_model.BayesianRidge` on all observations so far,
+        after standardising them with the running mean and standard deviation.
+
+        The eigendecomposition of the feature-space scatter matrix is used when there
+        are more observations than features, and that of the sample-space Gram matrix
+        otherwise, mirroring the two branches of `BayesianRidge`.
+
+        With a non-empty `batch_shape`, all arrays passed in and the fitted attributes
+        have these leading dimensions, and the linear algebra runs stacked across them.
+        """
+        self.n_features = n_features
+        self.max_samples = max_samples
+        self.max_iter = max_iter
+        self.tol = tol
+        self.alpha_1 = alpha_1
+        self.alpha_2 = alpha_2
+        self.lambda_1 = lambda_1
+        self.lambda_2 = lambda_2
+        self.alpha_init = alpha_init
+        self.lambda_init = lambda_init
+        self.batch_shape = tuple(batch_shape)
+
+        # only keep the scatter matrix if we will ever have more samples than features
+        self._keep_scatter = max_samples is None or max_samples > n_features
+
+        # the state is kept with a single flattened batch dimension
+        batch = int(np.prod(self.batch_shape))
+        self.n_samples = 0
+        self._mean = np.zeros((batch, n_features))
+        self._m2 = np.zeros((batch, n_features))
+        self._y_mean = np.zeros(batch)
+        self._y_m2 = np.zeros(batch)
+        self._Xy = np.zeros((batch, n_features))
+        self._XX = np.zeros((batch, n_features, n_features)) if self._keep_scatter else None
+        self._X = np.zeros((batch, max_samples or 0, n_features))
+        self._y = np.zeros((batch, max_samples or 0))
+        self._coef = np.zeros((batch, n_features))
+
+        self.alpha_ = None
+        self.lambda_ = None
+
+    @classmethod
+    def from_estimator(
+        cls,
+        estimator: BayesianRidge,  # Estimator to take the hyperparameters from.
+        n_features: int,  # Number of features of the observations.
+        max_samples: int | None = None,  # Expected number of observations.
+        batch_shape: tuple = (),  # Leading dimensions of independent regression problems.
+    ) -> IncrementalBayesianRidge:
+        """
+        Make an instance with the same hyperparameters as a `BayesianRidge`.
+        """
+        max_iter = getattr(estimator, "max_iter", None)
+        if max_iter is None:
+            # older versions of sklearn call it n_iter
+            n_iter = getattr(estimator, "n_iter", 300)
+            max_iter = n_iter if isinstance(n_iter, int) else 300
+
+        return cls(
+            n_features,
+            max_samples=max_samples,
+            max_iter=max_iter,
+            tol=estimator.tol,
+            alpha_1=estimator.alpha_1,
+            alpha_2=estimator.alpha_2,
+            lambda_1=estimator.lambda_1,
+            lambda_2=estimator.lambda_2,
+            alpha_init=estimator.alpha_init,
+            lambda_init=estimator.lambda_init,
+            batch_shape=batch_shape,
+        )
+
+    def _unflatten(self, array: np.ndarray) -> np.ndarray:
+        return array.reshape(self.batch_shape + array.shape[1:])
+
+    @property
+    def mean_(self) -> np.ndarray:
+        """
+        Running mean of the observations.
+        """
+        return self._unflatten(self._mean)
+
+    @property
+    def std_(self) -> np.ndarray:
+        """
+        Running standard deviation of the observations, with 0s replaced by 1s.
+        """
+        return self._unflatten(self._std())
+
+    @property
+    def coef_(self) -> np.ndarray:
+        """
+        Posterior mean of the coefficients of the standardised observations.
+        """
+        return self._unflatten(self._coef)
+
+    @property
+    def intercept_(self) -> np.ndarray | float:
+        """
+        Intercept of the standardised observations, which is the mean target.
+        """
+        intercept = self._unflatten(self._y_mean)
+        return float(intercept) if not self.batch_shape else intercept
+
+    def _std(self) -> np.ndarray:
+        if not self.n_samples:
+            return np.ones_like(self._m2)
+        std = np.sqrt(self._m2 / self.n_samples)
+        return np.where(std == 0, 1, std)
+
+    def update(
+        self,
+        X: np.ndarray,  # New observations -> (batch x) sample x feature
+        y: np.ndarray,  # New targets -> (batch x) sample
+    ):
+        """
+        Add new observations to the running statistics.
+        """
+        X = np.asarray(X, dtype=float).reshape(-1, *np.shape(X)[len(self.batch_shape) :])
+        if X.ndim == 2:
+            X = X[:, np.newaxis, :]
+        y = np.asarray(y, dtype=float).reshape(X.shape[:2])
+        n_new = X.shape[1]
+        n_total = self.n_samples + n_new
+
+        batch_mean = X.mean(axis=1)
+        batch_y_mean = y.mean(axis=1)
+        X_c = X - batch_mean[:, np.newaxis, :]
+        y_c = y - batch_y_mean[:, np.newaxis]
+
+        delta = batch_mean - self._mean
+        delta_y = batch_y_mean - self._y_mean
+        weight = self.n_samples * n_new / n_total
+
+        self._m2 += (X_c**2).sum(axis=1) + weight * delta**2
+        self._y_m2 += (y_c**2).sum(axis=1) + weight * delta_y**2
+        self._Xy += np.einsum("bnd,bn->bd", X_c, y_c) + weight * delta * delta_y[:, np.newaxis]
+        if self._keep_scatter:
+            self._XX += np.einsum("bnd,bne->bde", X_c, X_c) + weight * np.einsum("bd,be->bde", delta, delta)
+
+        self._mean = self._mean + delta * n_new / n_total
+        self._y_mean = self._y_mean + delta_y * n_new / n_total
+
+        if n_total > self._X.shape[1]:
+            extra = n_total - self._X.shape[1]
+            self._X = np.concatenate([self._X, np.zeros((self._X.shape[0], extra, self.n_features))], axis=1)
+            self._y = np.concatenate([self._y, np.zeros((self._y.shape[0], extra))], axis=1)
+        self._X[:, self.n_samples : n_total] = X
+        self._y[:, self.n_samples : n_total] = y
+
+        self.n_samples = n_total
+
+    def fit(self) -> IncrementalBayesianRidge:
+        """
+        Compute the posterior given all the observations so far.
+        """
+        n_samples = self.n_samples
+        std = self._std()
+
+        if n_samples > self.n_features:
+            # feature space: eigendecomposition of the standardised scatter matrix
+            eigen_vals, basis = np.linalg.eigh(self._XX / (std[:, :, np.newaxis] * std[:, np.newaxis, :]))
+            projected_y = np.einsum("bdr,bd->br", basis, self._Xy / std)
+            squared_y = projected_y**2
+        else:
+            # sample space: eigendecomposition of the standardised Gram matrix
+            Z = (self._X[:, :n_samples] - self._mean[:, np.newaxis, :]) / std[:, np.newaxis, :]
+            eigen_vals, U = np.linalg.eigh(Z @ Z.transpose(0, 2, 1))
+            eigen_vals = np.clip(eigen_vals, 0, None)
+            projected_y = np.einsum("bnr,bn->br", U, self._y[:, :n_samples] - self._y_mean[:, np.newaxis])
+            basis = Z.transpose(0, 2, 1) @ U
+            squared_y = eigen_vals * projected_y**2
+
+        eps = np.finfo(np.float64).eps
+        y_sum_squares = self._y_m2
+        if self.alpha_init is not None:
+            alpha_ = np.full(len(y_sum_squares), float(self.alpha_init))
+        else:
+            alpha_ = 1.0 / (y_sum_squares / n_samples + eps)
+        lambda_ = np.full(len(y_sum_squares), 1.0 if self.lambda_init is None else float(self.lambda_init))
+
+        def _posterior(alpha_, lambda_):
+            denominator = eigen_vals + (lambda_ / alpha_)[:, np.newaxis]
+            coef = np.einsum("bdr,br->bd", basis, projected_y / denominator)
+            coef_norm = (squared_y / denominator**2).sum(axis=1)
+            sse = y_sum_squares - (squared_y * (denominator + (lambda_ / alpha_)[:, np.newaxis]) / denominator**2).sum(axis=1)
+            return coef, coef_norm, np.maximum(sse, 0.0)
+
+        # every problem keeps iterating until its own coefficients converge
+        active = np.ones(len(alpha_), dtype=bool)
+        coef_old = None
+        for iter_ in range(self.max_iter):
+            coef, coef_norm, sse = _posterior(alpha_, lambda_)
+
+            gamma_ = np.sum((alpha_[:, np.newaxis] * eigen_vals) / (lambda_[:, np.newaxis] + alpha_[:, np.newaxis] * eigen_vals), axis=1)
+            lambda_ = np.where(active, (gamma_ + 2 * self.lambda_1) / (coef_norm + 2 * self.lambda_2), lambda_)
+            alpha_ = np.where(active, (n_samples - gamma_ + 2 * self.alpha_1) / (sse + 2 * self.alpha_2), alpha_)
+
+            if iter_ != 0:
+                active &= np.sum(np.abs(coef_old - coef), axis=1) >= self.tol
+                if not active.any():
+                    break
+            coef_old = coef
+
+        self.alpha_ = self._unflatten(alpha_)
+        self.lambda_ = self._unflatten(lambda_)
+        self._coef, _, _ = _posterior(alpha_, lambda_)
+
+        return self
+
+    def predict(
+        self,
+        X: np.ndarray,  # Observations -> (batch x) sample x feature
+    ) -> np.ndarray:  # Predicted targets -> (batch x) sample
+        """
+        Standardise the observations with the running statistics and predict their targets.
+        """
+        X = np.asarray(X, dtype=float)
+        flat_X = X.reshape(len(self._mean), -1, self.n_features)
+        # the standardised observations have zero mean, so the intercept is the mean target
+        predictions = (
+            np.einsum("bnd,bd->bn", (flat_X - self._mean[:, np.newaxis, :]) / self._std()[:, np.newaxis, :], self._coef)
+            + self._y_mean[:, np.newaxis]
+        )
+        return predictions.reshape(X.shape[:-1])
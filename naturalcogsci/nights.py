@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+
+__all__ = ["load_nights_triplets", "triplet_indices", "triplet_agreement", "score_embeddings"]
+
+
+from os.path import join
+from typing import Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from .feature_store import feature_name, open_features
+
+
+def load_nights_triplets(
+    project_root: str,  # project root
+) -> Tuple[pd.DataFrame, dict]:  # test triplets, and image path -> row of the extracted features
+    """
+    Read the NIGHTS test triplets with at least 6 votes and without ImageNet images,
+    and the order of the extracted features.
+    """
+    df = pd.read_csv(join(project_root, "data", "nights", "data.csv"))
+    df = df[(df.votes >= 6) & (~df.is_imagenet) & (df.split == "test")].reset_index(drop=True)
+
+    with open(join(project_root, "data", "nights_features", "file_names.txt"), "r") as f:
+        file_names = [line.strip().split("/lustre/groups/hcai/workspace/can.demircan/things_nights/dataset/nights/")[-1] for line in f]
+
+    return df, {name: i for i, name in enumerate(file_names)}
+
+
+def triplet_indices(
+    df: pd.DataFrame,  # NIGHTS triplets with `ref_path`, `left_path`, `right_path` and `left_vote` columns
+    file_to_index: dict,  # image path -> row of the embeddings
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:  # reference, left and right rows, and whether humans chose left
+    """
+    Resolve the images of the triplets into embedding rows once, to be reused for every model.
+    """
+    ref, left, right = (
+        np.array([file_to_index[x] for x in df[column]]) for column in ["ref_path", "left_path", "right_path"]
+    )
+    return ref, left, right, df["left_vote"].to_numpy() == 1
+
+
+def triplet_agreement(
+    embeddings: np.ndarray,  # images by features
+    ref: np.ndarray,  # rows of the reference images
+    left: np.ndarray,  # rows of the left images
+    right: np.ndarray,  # rows of the right images
+    human_left: np.ndarray,  # whether humans chose the left image as more similar to the reference
+) -> float:  # fraction of triplets where the model agrees with humans
+    """
+    Score a model on NIGHTS by whether the image with the higher cosine similarity to the reference is the human choice.
+    Ties count as the model choosing right.
+    """
+    # only the images in the triplets are normalized
+    rows, inverse = np.unique(np.concatenate([ref, left, right]), return_inverse=True)
+    normalized = np.asarray(embeddings[rows], dtype=np.float64)
+    norms = np.linalg.norm(normalized, axis=1, keepdims=True)
+    normalized /= np.where(norms == 0, 1, norms)
+
+    ref, left, right = np.split(normalized[inverse], 3)
+    model_left = (ref * left).sum(axis=1) > (ref * right).sum(axis=1)
+
+    return (model_left == human_left).mean()
+
+
+def _score_embedding(embedding_path: str, triplets: tuple) -> float:
+    return triplet_agreement(open_features(embedding_path), *triplets)
+
+
+def score_embeddings(
+    embedding_paths: Sequence[str],  # `.npy` files or chunked stores of images by features
+    df: pd.DataFrame,  # NIGHTS triplets, see `triplet_indices`
+    file_to_index: dict,  # image path -> row of the embeddings
+    n_jobs: int | None = None,  # number of processes, see `joblib.Parallel`
+) -> dict:  # file name without extension -> agreement
+    """
+    Score many models on the same triplets.
+    """
+    triplets = triplet_indices(df, file_to_index)
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(_score_embedding)(embedding_path, triplets) for embedding_path in embedding_paths
+    )
+    return {
+        feature_name(embedding_path): float(score)
+        for embedding_path, score in zip(embedding_paths, scores)
+    }
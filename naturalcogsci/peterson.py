@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+
+__all__ = ["PetersonBenchmark", "load_peterson_benchmark"]
+
+
+import pickle
+from os.path import basename, join
+from typing import Sequence
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.stats import rankdata
+
+from .feature_store import feature_name, open_features
+
+
+def _standardize(x: np.ndarray) -> np.ndarray:
+    # Pearson correlation of standardized vectors is their mean product
+    x = x - x.mean()
+    return x / np.sqrt((x**2).mean())
+
+
+class PetersonBenchmark:
+    def __init__(
+        self,
+        datasets: dict,  # category -> dict with the image `fnames` and the human `similarity` matrix
+        file_names: Sequence[str],  # image file names in the order of the feature rows
+        categories: Sequence[str] = ("fruits", "vegetables", "animals"),  # categories to average over
+    ):
+        """
+        Spearman correlation between human and model similarity judgements of the
+        [Peterson et al. (2018)](https://onlinelibrary.wiley.com/doi/full/10.1111/cogs.12670) image sets.
+
+        The feature rows of every category, the lower triangle of its similarity matrix
+        and the ranks of the human similarities are computed once, and reused for every model.
+        """
+        file_to_index = {file_name: row for row, file_name in enumerate(file_names)}
+        self.categories = list(categories)
+        self.indices = {}
+        self.tril_indices = {}
+        self.human_ranks = {}
+        for category in self.categories:
+            self.indices[category] = np.array([file_to_index[img] for img in datasets[category]["fnames"]])
+            self.tril_indices[category] = np.tril_indices(len(self.indices[category]), -1)
+            human_sim_vector = np.asarray(datasets[category]["similarity"])[self.tril_indices[category]]
+            self.human_ranks[category] = _standardize(rankdata(human_sim_vector))
+
+    def correlations(
+        self,
+        representation: np.ndarray,  # images by features, can be memory-mapped
+    ) -> dict:  # category -> Spearman correlation
+        correlations = {}
+        for category in self.categories:
+            features = np.asarray(representation[self.indices[category]], dtype=np.float64)
+            norms = np.linalg.norm(features, axis=1, keepdims=True)
+            features /= np.where(norms == 0, 1, norms)
+            model_sim_vector = (features @ features.T)[self.tril_indices[category]]
+            # Spearman correlation is the Pearson correlation of the ranks
+            model_ranks = _standardize(rankdata(model_sim_vector))
+            correlations[category] = (self.human_ranks[category] * model_ranks).mean()
+
+        return correlations
+
+    def __call__(
+        self,
+        representation: np.ndarray,  # images by features, can be memory-mapped
+    ) -> float:  # mean Spearman correlation over the categories
+        return float(np.mean(list(self.correlations(representation).values())))
+
+    def _score_file(self, representation_path: str) -> float:
+        return self(open_features(representation_path))
+
+    def score_files(
+        self,
+        representation_paths: Sequence[str],  # `.npy` files or chunked stores of images by features
+        n_jobs: int | None = None,  # number of processes, see `joblib.Parallel`
+    ) -> dict:  # file name without extension -> mean Spearman correlation
+        """
+        Score many models in parallel processes, each reading its features memory-mapped.
+        """
+        scores = Parallel(n_jobs=n_jobs)(delayed(self._score_file)(path) for path in representation_paths)
+        return {feature_name(path): score for path, score in zip(representation_paths, scores)}
+
+
+def load_peterson_benchmark(
+    project_root: str,  # project root
+) -> PetersonBenchmark:
+    """
+    Read the Peterson datasets and the order of the extracted features from `data`.
+    """
+    with open(join(project_root, "data", "peterson", "datasets_peterson.pkl"), "rb") as f:
+        datasets = pickle.load(f)
+
+    with open(join(project_root, "data", "peterson_features", "file_names.txt"), "r") as f:
+        file_names = [basename(x) for x in f.read().strip().split("\n")]
+
+    return PetersonBenchmark(datasets, file_names)
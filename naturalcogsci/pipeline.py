@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+
+__all__ = ["PipelineNode", "Pipeline", "build_pipeline", "PIPELINE_STAGES"]
+
+
+import json
+import os
+import shlex
+import subprocess
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os.path import join
+from typing import Sequence
+
+from .benchmarks import STIMULUS_SETS
+from .feature_store import content_hash, image_digests
+
+
+PIPELINE_STAGES = ["extraction", "learners", "loo", "metrics"]
+
+
+class PipelineNode:
+    def __init__(
+        self,
+        name: str,  # unique name of the node, e.g. 'learners/reward_learning/clip'
+        command: list,  # command to run, as for `subprocess.run`
+        dependencies: Sequence[str] = (),  # names of the nodes that have to run first
+        inputs: Sequence[str] = (),  # files read by the command that no node produces, e.g. behavioural data
+        outputs: Sequence[str] = (),  # files written by the command, removed before it reruns if `clean`
+        params=None,  # anything else that should rerun the node when it changes, e.g. a model config
+        clean: bool = False,  # remove the outputs before running, for scripts that skip existing outputs
+    ):
+        """
+        A step of the pipeline, run as a separate process.
+        """
+        self.name = name
+        self.command = [str(x) for x in command]
+        self.dependencies = list(dependencies)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params
+        self.clean = clean
+
+
+class Pipeline:
+    def __init__(
+        self,
+        state_dir: str,  # folder of the hashes of the nodes that ran successfully
+        cwd: str | None = None,  # working directory of the commands
+    ):
+        """
+        Dependency graph of pipeline steps that only reruns stale nodes.
+
+        The hash of a node combines its command, parameters, the content of its inputs and the hashes
+        of its dependencies, so a change anywhere upstream makes everything downstream stale.
+        A node is stale if its hash differs from the one recorded after its last successful run,
+        or if one of its outputs is missing.
+        """
+        self.state_dir = state_dir
+        self.cwd = cwd
+        self.nodes = {}
+        self._hashes = {}
+        os.makedirs(state_dir, exist_ok=True)
+
+    def add(self, node: PipelineNode) -> PipelineNode:
+        assert node.name not in self.nodes, f"{node.name} is already in the pipeline"
+        self.nodes[node.name] = node
+        return node
+
+    def _stamp_path(self, name: str) -> str:
+        return join(self.state_dir, f"{name.replace('/', '__')}.hash")
+
+    def node_hash(self, name: str) -> str:
+        if name not in self._hashes:
+            node = self.nodes[name]
+            self._hashes[name] = content_hash(
+                node.command,
+                node.params,
+                image_digests([x for x in node.inputs if os.path.exists(x)], join(self.state_dir, "digests.json")),
+                [self.node_hash(dependency) for dependency in node.dependencies],
+            )
+        return self._hashes[name]
+
+    def is_stale(self, name: str) -> bool:
+        node = self.nodes[name]
+        stamp_path = self._stamp_path(name)
+        if not os.path.exists(stamp_path) or not all(os.path.exists(x) for x in node.outputs):
+            return True
+        with open(stamp_path) as f:
+            return f.read().strip() != self.node_hash(name)
+
+    def order(self) -> list:
+        """
+        Names of the nodes, each after its dependencies.
+        """
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            assert name not in visiting, f"{name} depends on itself"
+            assert name in self.nodes, f"{name} is not in the pipeline"
+            visiting.add(name)
+            for dependency in self.nodes[name].dependencies:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def stale_nodes(self) -> list:
+        """
+        Names of the nodes that need to run, in dependency order. Everything downstream of a stale node is stale.
+        """
+        stale = set()
+        for name in self.order():
+            if self.is_stale(name) or any(dependency in stale for dependency in self.nodes[name].dependencies):
+                stale.add(name)
+        return [name for name in self.order() if name in stale]
+
+    def _prepare(self, name: str) -> None:
+        node = self.nodes[name]
+        if os.path.exists(self._stamp_path(name)):
+            os.remove(self._stamp_path(name))
+        if node.clean:
+            for output in node.outputs:
+                if os.path.isfile(output):
+                    os.remove(output)
+
+    def _run_local(self, name: str) -> bool:
+        self._prepare(name)
+        result = subprocess.run(self.nodes[name].command, cwd=self.cwd)
+        if result.returncode != 0:
+            return False
+        with open(self._stamp_path(name), "w") as f:
+            f.write(self.node_hash(name))
+        return True
+
+    def run(
+        self,
+        n_jobs: int = 1,  # number of nodes running at once
+        dry_run: bool = False,  # only return the stale nodes
+    ) -> dict:  # name of each stale node -> 'done', 'failed', 'skipped' (a dependency failed) or 'stale' for dry runs
+        """
+        Run the stale nodes locally, each as soon as its dependencies are done.
+        """
+        stale = self.stale_nodes()
+        if dry_run:
+            return {name: "stale" for name in stale}
+
+        # hashed before anything runs, so the inputs are hashed as they were before the run,
+        # and the worker threads only read the hashes
+        for name in self.order():
+            self.node_hash(name)
+
+        status = {}
+        waiting = list(stale)
+        running = {}
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            while waiting or running:
+                for name in list(waiting):
+                    dependencies = [x for x in self.nodes[name].dependencies if x in stale]
+                    if any(status.get(x) in ["failed", "skipped"] for x in dependencies):
+                        status[name] = "skipped"
+                        waiting.remove(name)
+                    elif all(status.get(x) == "done" for x in dependencies):
+                        running[pool.submit(self._run_local, name)] = name
+                        waiting.remove(name)
+
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    status[running.pop(future)] = "done" if future.result() else "failed"
+
+        return status
+
+    def submit_slurm(
+        self,
+        sbatch_args: Sequence[str] = (),  # extra `sbatch` arguments, e.g. `['--partition=cpu_p', '--mem=64G']`
+        node_sbatch_args: dict | None = None,  # stage (first part of the node name) -> extra `sbatch` arguments
+        dry_run: bool = False,  # only return the stale nodes
+    ) -> dict:  # name of each stale node -> slurm job id, or 'stale' for dry runs
+        """
+        Submit the stale nodes as slurm jobs that wait for the jobs of their dependencies.
+        Each job records its hash when it succeeds, so the next run only resubmits what failed or changed.
+        """
+        stale = self.stale_nodes()
+        if dry_run:
+            return {name: "stale" for name in stale}
+
+        node_sbatch_args = node_sbatch_args or {}
+        job_ids = {}
+        for name in stale:
+            self._prepare(name)
+            node = self.nodes[name]
+            command = shlex.join(node.command)
+            stamp = f"echo {self.node_hash(name)} > {shlex.quote(self._stamp_path(name))}"
+            if self.cwd is not None:
+                command = f"cd {shlex.quote(self.cwd)} && {command}"
+
+            dependencies = [job_ids[x] for x in node.dependencies if x in job_ids]
+            sbatch = ["sbatch", "--parsable", f"--job-name={name}", *sbatch_args]
+            sbatch += list(node_sbatch_args.get(name.split("/")[0], []))
+            if dependencies:
+                sbatch.append(f"--dependency=afterok:{':'.join(dependencies)}")
+            sbatch += ["--wrap", f"{command} && {stamp}"]
+
+            result = subprocess.run(sbatch, capture_output=True, text=True, check=True)
+            job_ids[name] = result.stdout.strip().split(";")[0]
+
+        return job_ids
+
+
+def build_pipeline(
+    project_root: str,  # project root
+    features: Sequence[str],  # models to run, keys of `model_configs.json` or the non-visual features
+    experiments: Sequence[str] = ("reward_learning", "category_learning"),  # tasks of the learners and LOO
+    stages: Sequence[str] = PIPELINE_STAGES,  # stages to include, their upstream nodes are only checked if included
+    regularisation: str = "l2",  # regularisation of the learners
+    transform: str = "original",  # transform of the features for the learners
+    loo_method: str = "exact",  # see `naturalcogsci.loo.loo_cv`
+    python: str = sys.executable,  # interpreter running the scripts in `bin`
+) -> Pipeline:
+    """
+    Build the extraction -> learners -> LOO graph for each model and task,
+    with the metrics of each model depending on its extraction and on the task embedding.
+    The NIGHTS and Peterson features of a model, which no node extracts, are inputs of its metrics.
+    """
+    for stage in stages:
+        assert stage in PIPELINE_STAGES, f"{stage} must be one of {PIPELINE_STAGES}"
+    bin_dir = join(project_root, "bin")
+    features_dir = join(project_root, "data", "features")
+    pipeline = Pipeline(join(project_root, "data", "pipeline"), cwd=project_root)
+
+    with open(join(project_root, "data", "model_configs.json")) as f:
+        model_configs = json.load(f)
+
+    def extraction(feature):
+        name = f"extraction/{feature}"
+        if "extraction" not in stages:
+            return []
+        if name not in pipeline.nodes:
+            pipeline.add(
+                PipelineNode(
+                    name,
+                    [python, join(bin_dir, "extract_features.py"), "-f", feature, "-c", "false"],
+                    outputs=[join(features_dir, f"{feature.replace('/', '_')}.npy")],
+                    params=model_configs.get(feature),
+                )
+            )
+        return [name]
+
+    def feature_inputs(*features):
+        # without the extraction stage, the saved features themselves decide whether downstream nodes are stale
+        if "extraction" in stages:
+            return []
+        return [join(features_dir, f"{feature.replace('/', '_')}.npy") for feature in features]
+
+    for feature in features:
+        file_name = feature.replace("/", "_")
+        extraction(feature)
+
+        for experiment in experiments:
+            learner_path = join(
+                project_root, "data", "learner_behavioural", experiment, f"{file_name}_{regularisation}_{transform}.csv"
+            )
+            learners = []
+            if "learners" in stages:
+                learners = [f"learners/{experiment}/{feature}"]
+                pipeline.add(
+                    PipelineNode(
+                        learners[0],
+                        [
+                            python, join(bin_dir, "run_learners.py"),
+                            "-e", experiment, "-f", feature, "-t", transform, "-r", regularisation,
+                        ],
+                        dependencies=extraction(feature),
+                        inputs=[join(project_root, "data", "human_behavioural", experiment, "above_chance.csv")]
+                        + feature_inputs(feature),
+                        outputs=[learner_path],
+                        clean=True,
+                    )
+                )
+            if "loo" in stages:
+                pipeline.add(
+                    PipelineNode(
+                        f"loo/{experiment}/{feature}",
+                        [
+                            python, join(bin_dir, "loo_cv.py"),
+                            "-f", feature, "-e", experiment, "-r", regularisation, "-t", transform,
+                            "-m", loo_method, "--overwrite", "true",
+                        ],
+                        dependencies=learners,
+                        outputs=[learner_path],
+                    )
+                )
+
+        if "metrics" in stages:
+            other_stimulus_sets = [
+                join(project_root, "data", folder, f"{file_name}.npy")
+                for stimulus_set, folder in STIMULUS_SETS.items()
+                if stimulus_set != "things"
+            ]
+            pipeline.add(
+                PipelineNode(
+                    f"metrics/{feature}",
+                    [python, join(bin_dir, "run_benchmarks.py"), "-f", feature, "-n", file_name],
+                    dependencies=extraction(feature) + extraction("task"),
+                    inputs=feature_inputs(feature, "task") + other_stimulus_sets,
+                    outputs=[join(project_root, "data", "benchmarks", f"{file_name}.csv")],
+                )
+            )
+
+    return pipeline
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+
+__all__ = ["pixel_batches", "pixel_pca", "PCA_SOLVERS"]
+
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Sequence
+
+import numpy as np
+from sklearn.decomposition import IncrementalPCA
+from sklearn.utils.extmath import svd_flip
+
+from .image_cache import ImageCache, load_image
+
+
+PCA_SOLVERS = ["full", "incremental", "randomized"]
+
+
+def pixel_batches(
+    file_paths: Sequence[str],  # image files, in the order of the rows
+    batch_size: int = 1024,  # number of images per batch
+    size: int = 224,  # side length the images are resized to
+    n_jobs: int = 1,  # number of threads decoding images, unused with a cache
+    cache: ImageCache | None = None,  # decoded images to read instead of the image files
+) -> Iterator[np.ndarray]:  # batches of flattened images as float32
+    """
+    Yield the flattened pixels of the images batch by batch, so that at most one batch is in memory.
+    """
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for start in range(0, len(file_paths), batch_size):
+            end = min(start + batch_size, len(file_paths))
+            if cache is not None:
+                images = np.asarray(cache.images[start:end])
+            else:
+                images = np.stack(list(pool.map(lambda x: load_image(x, size), file_paths[start:end])))
+            yield images.reshape(end - start, -1).astype(np.float32)
+
+
+def pixel_pca(
+    file_paths: Sequence[str],  # image files, in the order of the rows
+    n_components: int = 49,  # number of principal components
+    solver: str = "incremental",  # 'incremental' for `IncrementalPCA`, 'randomized' for an out-of-core randomized SVD
+    batch_size: int = 1024,  # number of images in memory at once
+    size: int = 224,  # side length the images are resized to
+    n_jobs: int = 1,  # number of threads decoding images
+    cache: ImageCache | None = None,  # decoded images to read instead of the image files
+    n_oversamples: int = 10,  # extra random directions of the randomized solver
+    n_iter: int = 4,  # power iterations of the randomized solver
+    random_state: int | None = 0,  # seed of the randomized solver
+) -> np.ndarray:  # images by components array
+    """
+    Project the pixels of the images onto their principal components without holding
+    all images in memory.
+
+    The incremental solver needs one pass over the images to fit and one to transform.
+    The randomized solver follows Halko et al. (2011) with the mean subtracted on the fly,
+    and needs `2 * n_iter + 3` passes, so it is best combined with an image cache.
+    """
+    assert solver in PCA_SOLVERS[1:], f"{solver} must be one of {PCA_SOLVERS[1:]}"
+
+    def batches():
+        return pixel_batches(file_paths, batch_size=batch_size, size=size, n_jobs=n_jobs, cache=cache)
+
+    if solver == "incremental":
+        assert batch_size >= n_components, "batch_size must be at least n_components"
+        pca = IncrementalPCA(n_components=n_components)
+        for batch in batches():
+            # the last batch may be too small for partial_fit
+            if len(batch) >= n_components:
+                pca.partial_fit(batch)
+        return np.concatenate([pca.transform(batch) for batch in batches()])
+
+    mean = None
+    for batch in batches():
+        batch_sum = batch.sum(0, dtype=np.float64)
+        mean = batch_sum if mean is None else mean + batch_sum
+    mean = (mean / len(file_paths)).astype(np.float32)
+
+    def project(matrix):
+        # (X - mean) @ matrix, with X read batch by batch
+        return np.concatenate([(batch - mean) @ matrix for batch in batches()])
+
+    def project_transposed(matrix):
+        # (X - mean).T @ matrix
+        result = np.zeros((len(mean), matrix.shape[1]), dtype=np.float32)
+        start = 0
+        for batch in batches():
+            result += (batch - mean).T @ matrix[start : start + len(batch)]
+            start += len(batch)
+        return result
+
+    rng = np.random.default_rng(random_state)
+    n_random = n_components + n_oversamples
+    Q, _ = np.linalg.qr(project(rng.standard_normal((len(mean), n_random), dtype=np.float32)))
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(project(np.linalg.qr(project_transposed(Q))[0]))
+
+    U, S, Vt = np.linalg.svd(project_transposed(Q).T, full_matrices=False)
+    U, Vt = svd_flip(Q @ U, Vt, u_based_decision=False)
+
+    return U[:, :n_components] * S[:n_components]
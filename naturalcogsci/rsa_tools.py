@@ -1,77 +1,320 @@
 from __future__ import annotations
 
 
-__all__ = ["cka", "class_separation"]
+__all__ = ["cka", "CKATarget", "cka_matrix", "hsic_unbiased", "class_separation"]
+
+from typing import Sequence
 
 import numpy as np
-from scipy.spatial.distance import cdist, pdist
-from tqdm import tqdm
+from joblib import Parallel, delayed
+from scipy.sparse import csr_matrix
+
+from .feature_store import open_features
+
+
+CKA_METHODS = ["auto", "feature", "gram", "minibatch"]
 
 
 def cka(
     X: np.ndarray,  # Representations of the first set of samples.
     Y: np.ndarray,  # Representations of the second set of samples.
+    method: str = "auto",  # 'feature', 'gram', 'minibatch', or 'auto' to choose between the first two by shape. See `CKATarget`.
+    chunk_size: int = 4096,  # Number of rows read at once by the feature space formulation.
+    batch_size: int = 1024,  # Number of observations per minibatch, at most the number of observations.
 ) -> float:  # The linear CKA between X and Y.
     """
     Compute the linear CKA between two matrices X and Y.
 
     [link to the paper](https://arxiv.org/abs/1905.00414)
 
-    taken from Patrick Mineault's implementation of CKA as is.
+    Originally taken from Patrick Mineault's implementation of CKA.
 
     [link to original implementation](https://goodresearch.dev/cka.html)
 
-    Matrices should be observations by features.
+    Matrices should be observations by features. They can be memory-mapped,
+    in which case the feature space formulation only reads `chunk_size` rows at a time.
+
+    """
+    return CKATarget(Y, method=method, chunk_size=chunk_size, batch_size=batch_size)(X)
+
 
+def hsic_unbiased(
+    K: np.ndarray,  # Gram matrix of the first representation.
+    L: np.ndarray,  # Gram matrix of the second representation.
+) -> float:  # Unbiased estimate of HSIC.
     """
-    # Implements linear CKA as in Kornblith et al. (2019)
-    X = X.copy()
-    Y = Y.copy()
+    Unbiased HSIC estimator of [Song et al. (2012)](https://jmlr.org/papers/v13/song12a.html), needs at least 4 samples.
+    """
+    n = len(K)
+    K = K.copy()
+    L = L.copy()
+    np.fill_diagonal(K, 0)
+    np.fill_diagonal(L, 0)
+
+    return (
+        (K * L).sum() + K.sum() * L.sum() / ((n - 1) * (n - 2)) - 2 / (n - 2) * K.sum(0) @ L.sum(0)
+    ) / (n * (n - 3))
+
+
+def _centered_gram(X: np.ndarray) -> np.ndarray:
+    X = np.asarray(X, dtype=np.float64)
+    X = X - X.mean(axis=0)
+    return X @ X.T
+
+
+class CKATarget:
+    def __init__(
+        self,
+        Y: np.ndarray,  # Representations of the target, observations by features.
+        method: str = "auto",  # 'feature', 'gram', 'minibatch', or 'auto'.
+        chunk_size: int = 4096,  # Number of rows read at once by the feature space formulation.
+        batch_size: int = 1024,  # Number of observations per minibatch, at most the number of observations.
+        n_epochs: int = 1,  # Number of passes over shuffled minibatches.
+        random_state: int | None = 0,  # Seed of the minibatch order, shared by all comparisons.
+    ):
+        """
+        Linear CKA against a fixed target, whose statistics are computed once and reused for every comparison.
+
+        - 'feature' uses the cross-covariances, $\\|Y_c^T X_c\\|_F^2$, and reads X in row chunks,
+          so X can be a memory-mapped array with many more rows than fit in memory.
+        - 'gram' uses the centered Gram matrices, which is cheaper when there are fewer observations than features.
+        - 'auto' picks 'gram' if X has more features than observations, and 'feature' otherwise.
+        - 'minibatch' averages unbiased HSIC over random minibatches as in
+          [Nguyen et al. (2021)](https://arxiv.org/abs/2010.15327), which is not exactly the full-data CKA.
+        """
+        assert method in CKA_METHODS, f"{method} must be one of {CKA_METHODS}"
+        self.method = method
+        self.chunk_size = chunk_size
+        self.Y = Y
+        self.n = len(Y)
+
+        self._Yc = None
+        self._hsic_yy_feature = None
+        self._L = None
+
+        if method == "minibatch":
+            rng = np.random.default_rng(random_state)
+            # small stimulus sets make a single batch of all observations
+            batch_size = min(batch_size, self.n)
+            n_batches = self.n // batch_size
+            assert n_batches > 0 and batch_size > 3, "need at least one minibatch of 4 or more observations"
+            self.batches = [
+                np.sort(batch)
+                for _ in range(n_epochs)
+                for batch in rng.permutation(self.n)[: n_batches * batch_size].reshape(n_batches, batch_size)
+            ]
+            self.L_batches = [_centered_gram(Y[batch]) for batch in self.batches]
+            self.hsic_yy_minibatch = sum(hsic_unbiased(L, L) for L in self.L_batches)
+
+    @property
+    def Yc(self) -> np.ndarray:
+        # centered target, its columns sum to zero, so Y_c^T X = Y_c^T X_c
+        if self._Yc is None:
+            Y = np.asarray(self.Y, dtype=np.float64)
+            self._Yc = Y - Y.mean(axis=0)
+            self._hsic_yy_feature = ((self._Yc.T @ self._Yc) ** 2).sum()
+        return self._Yc
+
+    @property
+    def L(self) -> np.ndarray:
+        if self._L is None:
+            self._L = _centered_gram(self.Y)
+        return self._L
+
+    def __call__(
+        self,
+        X: np.ndarray,  # Representations of the same observations as the target.
+    ) -> float:  # The linear CKA between X and the target.
+        assert len(X) == self.n, "X and the target must have the same number of observations"
+        method = self.method
+        if method == "auto":
+            method = "gram" if X.shape[1] > self.n else "feature"
+
+        if method == "feature":
+            return self._feature_cka(X)
+        elif method == "gram":
+            K = _centered_gram(X)
+            return (K * self.L).sum() / np.sqrt((K**2).sum() * (self.L**2).sum())
+        else:
+            hsic_xy = 0
+            hsic_xx = 0
+            for batch, L in zip(self.batches, self.L_batches):
+                K = _centered_gram(X[batch])
+                hsic_xy += hsic_unbiased(K, L)
+                hsic_xx += hsic_unbiased(K, K)
+            return hsic_xy / np.sqrt(hsic_xx * self.hsic_yy_minibatch)
+
+    def _feature_cka(self, X: np.ndarray) -> float:
+        Yc = self.Yc
+        n, d = X.shape
+        # shift by the mean of the first chunk to keep the one-pass covariance accurate
+        shift = np.asarray(X[: min(self.chunk_size, n)], dtype=np.float64).mean(axis=0)
+        ZTZ = np.zeros((d, d))
+        z_sum = np.zeros(d)
+        YTX = np.zeros((Yc.shape[1], d))
+        for start in range(0, n, self.chunk_size):
+            Z = np.asarray(X[start : start + self.chunk_size], dtype=np.float64) - shift
+            ZTZ += Z.T @ Z
+            z_sum += Z.sum(axis=0)
+            YTX += Yc[start : start + self.chunk_size].T @ Z
+
+        XTX = ZTZ - np.outer(z_sum, z_sum) / n
+
+        return (YTX**2).sum() / np.sqrt((XTX**2).sum() * self._hsic_yy_feature)
+
+
+def _cka_statistics(
+    X: np.ndarray | str,  # observations by features, or a `.npy` file or chunked store
+    n_components: int | None,  # number of principal components to keep, `None` to keep all features
+    chunk_size: int,  # number of rows read at once
+) -> tuple:  # mean, projection onto the principal components or `None`, and HSIC of the representation with itself
+    # P = (X - mean) @ projection has P P^T = X_c X_c^T (or its best rank `n_components` approximation)
+    if isinstance(X, str):
+        X = open_features(X)
+    n, d = X.shape
 
-    # Center X and Y
-    X -= X.mean(axis=0)
-    Y -= Y.mean(axis=0)
+    mean = np.zeros(d)
+    for start in range(0, n, chunk_size):
+        mean += np.asarray(X[start : start + chunk_size], dtype=np.float64).sum(axis=0)
+    mean /= n
 
-    # Calculate CKA
-    XTX = X.T.dot(X)
-    YTY = Y.T.dot(Y)
-    YTX = Y.T.dot(X)
+    XTX = np.zeros((d, d))
+    for start in range(0, n, chunk_size):
+        chunk = np.asarray(X[start : start + chunk_size], dtype=np.float64) - mean
+        XTX += chunk.T @ chunk
 
-    return (YTX**2).sum() / np.sqrt((XTX**2).sum() * (YTY**2).sum())
+    projection = None
+    if n_components is not None and n_components < d:
+        _, eigenvectors = np.linalg.eigh(XTX)
+        projection = eigenvectors[:, ::-1][:, :n_components]
+        XTX = projection.T @ XTX @ projection
+
+    return mean, projection, (XTX**2).sum()
+
+
+def _cka_chunk(X, mean, projection, start, chunk_size) -> np.ndarray:
+    chunk = np.asarray(X[start : start + chunk_size], dtype=np.float64) - mean
+    return chunk if projection is None else chunk @ projection
+
+
+def _cka_width(mean, projection) -> int:
+    return len(mean) if projection is None else projection.shape[1]
+
+
+def _cka_block(
+    models_a: list,  # features, mean and projection of the first block of models
+    models_b: list | None,  # same for the second block, `None` for the first block with itself
+    chunk_size: int,  # number of rows read at once
+) -> np.ndarray:  # HSIC between every model of the two blocks
+    models_a = [(open_features(X) if isinstance(X, str) else X, mean, projection) for X, mean, projection in models_a]
+    if models_b is not None:
+        models_b = [(open_features(X) if isinstance(X, str) else X, mean, projection) for X, mean, projection in models_b]
+
+    cross = None
+    for start in range(0, len(models_a[0][0]), chunk_size):
+        A = np.hstack([_cka_chunk(*model, start, chunk_size) for model in models_a])
+        B = A if models_b is None else np.hstack([_cka_chunk(*model, start, chunk_size) for model in models_b])
+        cross = A.T @ B if cross is None else cross + A.T @ B
+
+    models_b = models_a if models_b is None else models_b
+    widths_a = np.cumsum([0] + [_cka_width(mean, projection) for _, mean, projection in models_a])
+    widths_b = np.cumsum([0] + [_cka_width(mean, projection) for _, mean, projection in models_b])
+    return np.array(
+        [
+            [(cross[widths_a[i] : widths_a[i + 1], widths_b[j] : widths_b[j + 1]] ** 2).sum() for j in range(len(models_b))]
+            for i in range(len(models_a))
+        ]
+    )
+
+
+def cka_matrix(
+    features: Sequence[np.ndarray | str],  # Representations of the same observations, arrays, `.npy` files or chunked stores.
+    n_components: int | None = None,  # If given, keep only this many principal components of wider models.
+    block_features: int = 4096,  # Maximum number of features of a block of models multiplied at once.
+    chunk_size: int = 4096,  # Number of rows read at once.
+    n_jobs: int | None = None,  # Number of processes, see `joblib.Parallel`.
+) -> np.ndarray:  # Models by models linear CKA matrix.
+    """
+    Compute the linear CKA between every pair of representations.
+
+    The mean (and optionally the principal components) and the self-similarity of each representation
+    are computed once. The cross terms are then formed by blocked matrix products over groups of models,
+    which are distributed over processes and center the row chunks as they are read, so nothing but these
+    statistics is kept besides the features.
+
+    Everything is computed in float64, so without `n_components` the result matches `cka` for every pair
+    up to rounding. With it, the CKA of wide models is that of their leading principal components,
+    which makes the cross products cheaper.
+    """
+    statistics = Parallel(n_jobs=n_jobs)(
+        delayed(_cka_statistics)(X, n_components, chunk_size) for X in features
+    )
+    models = [(X, mean, projection) for X, (mean, projection, _) in zip(features, statistics)]
+    self_hsic = np.array([hsic for _, _, hsic in statistics])
+
+    # group consecutive models so that each block has at most `block_features` features
+    blocks = [[]]
+    block_width = 0
+    for i, (_, mean, projection) in enumerate(models):
+        width = _cka_width(mean, projection)
+        if blocks[-1] and block_width + width > block_features:
+            blocks.append([])
+            block_width = 0
+        blocks[-1].append(i)
+        block_width += width
+
+    pairs = [(a, b) for a in range(len(blocks)) for b in range(a, len(blocks))]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_cka_block)(
+            [models[i] for i in blocks[a]], None if a == b else [models[j] for j in blocks[b]], chunk_size
+        )
+        for a, b in pairs
+    )
+
+    hsic = np.zeros((len(features), len(features)))
+    for (a, b), result in zip(pairs, results):
+        hsic[np.ix_(blocks[a], blocks[b])] = result
+        hsic[np.ix_(blocks[b], blocks[a])] = result.T
+
+    return hsic / np.sqrt(np.outer(self_hsic, self_hsic))
 
 
 def class_separation(
-    X: np.ndarray,  # Feature by observation representation matrix.
+    X: np.ndarray,  # Observation by feature representation matrix.
     classes: np.ndarray,  # Class labels for each observation.
+    chunk_size: int | None = None,  # If given, read X in chunks of this many rows, e.g. for memory-mapped arrays.
 ) -> float:  # The class separation of X
     """
     Compute the class separation $R^2$ as defined in [this paper](https://arxiv.org/abs/2010.16402)
+
+    The mean cosine distances are computed exactly from the per-class sums $s_c$ of the L2-normalized
+    observations, as the sum of cosine similarities between two sets is the dot product of their sums:
+
+    $\\bar{d}_{within} = \\sum_c \\frac{n_c^2 - \\|s_c\\|^2}{2 K n_c^2}$ and
+    $\\bar{d}_{total} = 1 - \\frac{1}{K^2} \\|\\sum_c s_c / n_c\\|^2$,
+
+    which takes $O(N D)$ time instead of $O(N^2 D)$.
     """
-    unique_classes = np.unique(classes)
+    unique_classes, labels = np.unique(classes, return_inverse=True)
+    labels = labels.reshape(-1)
     total_classes = len(unique_classes)
-    d_within = 0
-    d_total = 0
-
-
-    # Compute the within class distance
-    for cls_ in tqdm(unique_classes):
-        class_examples = X[classes == cls_]
-        total_examples = len(class_examples)
-        # Compute pairwise cosine distances for examples in the same class
-        pairwise_distances = pdist(class_examples, metric="cosine")
-        # Sum up the distances and normalize
-        d_within += pairwise_distances.sum() / (total_classes * total_examples**2)
-
-    # Compute the total distance
-    for cls_1 in tqdm(unique_classes):
-        cls_1_examples = X[classes == cls_1]
-        for cls_2 in unique_classes:
-            cls_2_examples = X[classes == cls_2]
-            # Compute pairwise cosine distances for examples from different classes
-            pairwise_distances = cdist(cls_1_examples, cls_2_examples, metric="cosine")
-            # Sum up the distances and normalize
-            d_total += pairwise_distances.sum() / (
-                total_classes**2 * len(cls_1_examples) * len(cls_2_examples)
-            )
+    counts = np.bincount(labels, minlength=total_classes)
+
+    n = len(X)
+    chunk_size = chunk_size or max(n, 1)
+    sums = np.zeros((total_classes, X.shape[1]))
+    for start in range(0, n, chunk_size):
+        chunk = np.asarray(X[start : start + chunk_size], dtype=np.float64)
+        chunk = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+        chunk_labels = labels[start : start + chunk_size]
+        # sum the observations of each class with a sparse one-hot matrix
+        one_hot = csr_matrix(
+            (np.ones(len(chunk_labels)), (chunk_labels, np.arange(len(chunk_labels)))),
+            shape=(total_classes, len(chunk_labels)),
+        )
+        sums += one_hot @ chunk
+
+    d_within = ((counts**2 - (sums**2).sum(axis=1)) / (2 * total_classes * counts**2)).sum()
+    d_total = 1 - ((sums / counts[:, None]).sum(axis=0) ** 2).sum() / total_classes**2
 
     return 1 - d_within / d_total
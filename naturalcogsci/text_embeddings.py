@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+
+__all__ = ["embed_texts", "HuggingFaceBackend", "FastTextBackend", "OpenAIBackend", "FunctionBackend"]
+
+
+import os
+from typing import Callable, Sequence
+
+import numpy as np
+import openai
+import torch
+from transformers import AutoTokenizer, AutoModel
+
+
+def embed_texts(
+    texts: Sequence[str],  # one text per row, usually with many duplicates
+    backend,  # any object with an `embed(texts) -> np.ndarray` method, e.g. `HuggingFaceBackend`
+) -> np.ndarray:  # texts by features array
+    """
+    Embed each unique text once and scatter the embeddings back to the rows.
+    """
+    unique_texts, inverse = np.unique(np.asarray(texts, dtype=object), return_inverse=True)
+    features = np.asarray(backend.embed(list(unique_texts)))
+    return features[inverse.reshape(-1)]
+
+
+def _batches(
+    texts: list,  # texts to split
+    batch_size: int | None,  # number of texts per batch, `None` for a single batch
+):
+    batch_size = batch_size or max(len(texts), 1)
+    for start in range(0, len(texts), batch_size):
+        yield texts[start : start + batch_size]
+
+
+class HuggingFaceBackend:
+    def __init__(
+        self,
+        model_name: str,  # name of the model on the HuggingFace hub, e.g. 'bert-base-uncased'
+        batch_size: int = 256,  # number of texts per forward pass
+        device: str | None = None,  # torch device, defaults to cuda if available
+    ):
+        """
+        CLS token of the last hidden state of a HuggingFace encoder, computed in padded batches.
+        """
+        self.batch_size = batch_size
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(self.device).eval()
+
+    def embed(self, texts: list) -> np.ndarray:
+        features = []
+        for batch in _batches(texts, self.batch_size):
+            tokenized = self.tokenizer(batch, padding=True, truncation=True, return_tensors="pt")
+            tokenized = {k: v.to(self.device) for k, v in tokenized.items()}
+            with torch.no_grad():
+                latent = self.model(**tokenized)
+            features.append(latent.last_hidden_state[:, 0, :].cpu().numpy())
+
+        return np.concatenate(features)
+
+
+class FastTextBackend:
+    def __init__(
+        self,
+        model,  # loaded fasttext model, e.g. from `fasttext.load_model`
+    ):
+        """
+        fastText word vectors.
+        """
+        self.model = model
+
+    def embed(self, texts: list) -> np.ndarray:
+        return np.stack([self.model.get_word_vector(x) for x in texts])
+
+
+class OpenAIBackend:
+    def __init__(
+        self,
+        model: str = "text-embedding-ada-002",  # embedding model
+        batch_size: int = 1000,  # number of texts per request, at most 2048
+        api_key: str | None = None,  # defaults to the `OPENAI_API_KEY` environment variable
+        api_base: str | None = None,  # URL of the API, e.g. a local server that mimics the embeddings endpoint
+    ):
+        """
+        Embeddings from the OpenAI API, requesting many texts at once.
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.api_base = api_base
+
+    def embed(self, texts: list) -> np.ndarray:
+        features = []
+        for batch in _batches([x.replace("\n", " ") for x in texts], self.batch_size):
+            kwargs = {} if self.api_base is None else {"api_base": self.api_base}
+            response = openai.Embedding.create(input=batch, model=self.model, api_key=self.api_key, **kwargs)
+            # the API does not guarantee the order of the embeddings
+            data = sorted(response["data"], key=lambda x: x["index"])
+            features.append(np.array([x["embedding"] for x in data]))
+
+        return np.concatenate(features)
+
+
+class FunctionBackend:
+    def __init__(
+        self,
+        function: Callable,  # maps a list of texts to a texts by features array
+        batch_size: int | None = None,  # number of texts per call, `None` for a single call
+    ):
+        """
+        Wrap any function as a backend, e.g. a TensorFlow Hub model.
+        """
+        self.function = function
+        self.batch_size = batch_size
+
+    def embed(self, texts: list) -> np.ndarray:
+        return np.concatenate([np.asarray(self.function(batch)) for batch in _batches(texts, self.batch_size)])
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+
+__all__ = ["TrialDesign", "TRIALS"]
+
+
+import os
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# number of trials of each condition file
+TRIALS = {"reward_learning": 60, "category_learning": 120}
+
+
+class TrialDesign:
+    def __init__(
+        self,
+        task: str,  # 'reward_learning' or 'category_learning'
+        cond_files: np.ndarray,  # condition files, as strings
+        rows: np.ndarray,  # condition files x trials (x options) feature rows of the stimuli
+        targets: np.ndarray,  # condition files x trials (x options) rewards or categories
+        counts: np.ndarray,  # number of trials of each condition file
+        row_order_hash: str,  # `feature_store.row_order_hash` of the file names the rows refer to
+        source: str = "",  # identifies the version of the behavioural data the design was built from
+    ):
+        """
+        Stimulus rows and targets of every condition file of a task, which do not depend on the features,
+        so that preparing the training data of any features is a single gather.
+        """
+        self.task = task
+        self.cond_files = np.asarray(cond_files).astype(str)
+        self.rows = rows
+        self.targets = targets
+        self.counts = counts
+        self.row_order_hash = row_order_hash
+        self.source = source
+        self.position = {cond_file: i for i, cond_file in enumerate(self.cond_files)}
+
+    def __getitem__(
+        self,
+        cond_file,  # condition file
+    ) -> Tuple[np.ndarray, np.ndarray]:  # feature rows and targets of its trials
+        i = self.position[str(cond_file)]
+        return self.rows[i, : self.counts[i]], self.targets[i, : self.counts[i]]
+
+    @classmethod
+    def build(
+        cls,
+        task: str,  # 'reward_learning' or 'category_learning'
+        df: pd.DataFrame,  # behavioural data with a `cond_file` column
+        index: dict,  # image path -> feature row
+        row_order_hash: str,  # `feature_store.row_order_hash` of the file names of `index`
+        source: str = "",  # identifies the version of `df`
+    ) -> TrialDesign:
+        """
+        Compile the design from the behavioural data. The first trials of each condition file are used,
+        as in `helpers.prepare_training`.
+        """
+        trials = TRIALS[task]
+        if task == "reward_learning":
+            image_columns, target_columns = ["left_image", "right_image"], ["left_reward", "right_reward"]
+        else:
+            image_columns, target_columns = ["image"], ["true_category_binary"]
+
+        cond_files, rows, targets, counts = [], [], [], []
+        for cond_file, cond_df in df.groupby("cond_file", sort=False):
+            cond_df = cond_df.iloc[:trials]
+            cond_rows = np.zeros((trials, len(image_columns)), dtype=np.intp)
+            cond_rows[: len(cond_df)] = np.stack(
+                [[index[image] for image in cond_df[column]] for column in image_columns], axis=1
+            )
+            cond_targets = np.zeros((trials, len(target_columns)), dtype=cond_df[target_columns[0]].dtype)
+            cond_targets[: len(cond_df)] = cond_df[target_columns].to_numpy()
+
+            cond_files.append(str(cond_file))
+            rows.append(cond_rows)
+            targets.append(cond_targets)
+            counts.append(len(cond_df))
+
+        rows, targets = np.stack(rows), np.stack(targets)
+        if task == "category_learning":
+            rows, targets = rows[..., 0], targets[..., 0]
+
+        return cls(task, np.array(cond_files), rows, targets, np.array(counts), row_order_hash, source)
+
+    def save(
+        self,
+        path: str,  # `.npz` file
+    ) -> None:
+        # written to a temporary file first, as several processes may build the design at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                task=self.task,
+                cond_files=self.cond_files,
+                rows=self.rows,
+                targets=self.targets,
+                counts=self.counts,
+                row_order_hash=self.row_order_hash,
+                source=self.source,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,  # `.npz` file written by `save`
+    ) -> TrialDesign:
+        with np.load(path) as design:
+            return cls(
+                str(design["task"]),
+                design["cond_files"],
+                design["rows"],
+                design["targets"],
+                design["counts"],
+                str(design["row_order_hash"]),
+                str(design["source"]),
+            )
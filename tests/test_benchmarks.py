@@ -0,0 +1,25 @@
+import numpy as np
+
+from naturalcogsci.benchmarks import BenchmarkRunner
+from naturalcogsci.feature_store import write_features
+
+
+def test_features_are_read_once_for_all_metrics(tmp_path, monkeypatch):
+    features_dir = tmp_path / "data" / "features"
+    features_dir.mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    np.save(features_dir / "task.npy", np.repeat(rng.normal(size=(10, 4)), 6, axis=0))
+    write_features(str(features_dir / "model"), rng.normal(size=(60, 8)).astype(np.float32), chunk_rows=16)
+
+    metrics = ["cka", "class_separation", "intrinsic_dimensionality"]
+    in_memory = BenchmarkRunner(str(tmp_path), metrics=metrics).run_model("model")
+    memory_mapped = BenchmarkRunner(str(tmp_path), metrics=metrics, memory_limit=0).run_model("model")
+    for key in ["cka", "r2", "local ID"]:
+        np.testing.assert_allclose(in_memory[key], memory_mapped[key], rtol=1e-12)
+
+    # each metric gets the same in-memory array
+    received = []
+    monkeypatch.setattr(BenchmarkRunner, "_compute", lambda self, metric, features: received.append(features) or {})
+    BenchmarkRunner(str(tmp_path), metrics=metrics).run_model("model")
+    assert len(received) == 3
+    assert all(type(features) is np.ndarray and features is received[0] for features in received)
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pytest
+
+feature_extractors = pytest.importorskip("naturalcogsci.feature_extractors")
+
+
+class _Stop(Exception):
+    pass
+
+
+def _write_model_configs(project_root, model_configs):
+    (project_root / "data").mkdir(exist_ok=True)
+    with open(project_root / "data" / "model_configs.json", "w") as f:
+        json.dump(model_configs, f)
+
+
+def test_get_visual_embedding_model_name(tmp_path, monkeypatch):
+    expected = {
+        "alexnet": ("alexnet", None),
+        "clip_ViT-B/32": ("clip", {"variant": "ViT-B/32"}),
+        "OpenCLIP_ViT-H-14_laion2b_s32b_b79k": ("OpenCLIP", {"variant": "ViT-H-14", "dataset": "laion2b_s32b_b79k"}),
+        "DreamSim_open_clip_vitb32": ("DreamSim", {"variant": "open_clip_vitb32"}),
+    }
+    _write_model_configs(tmp_path, {name: {"source": "custom", "module_name": "visual"} for name in expected})
+
+    calls = []
+
+    def get_extractor(**kwargs):
+        calls.append(kwargs)
+        raise _Stop
+
+    monkeypatch.setattr(feature_extractors, "get_extractor", get_extractor)
+
+    for feature_name, (model_name, model_parameters) in expected.items():
+        with pytest.raises(_Stop):
+            feature_extractors.get_visual_embedding(str(tmp_path), feature_name)
+        assert calls[-1]["model_name"] == model_name
+        assert calls[-1]["model_parameters"] == model_parameters
+
+
+def test_extract_features_modules_with_complete_default_output(tmp_path, monkeypatch):
+    _write_model_configs(tmp_path, {"alexnet": {"source": "torchvision", "module_name": "classifier.4"}})
+    features_dir = tmp_path / "data" / "features"
+    features_dir.mkdir()
+    np.save(features_dir / "alexnet.npy", np.zeros((3, 2)))
+
+    calls = []
+
+    def get_visual_embedding(project_root, feature_name, output_path=None, module_names=None, **kwargs):
+        calls.append(module_names)
+        for module_name in module_names:
+            np.save(feature_extractors.layer_feature_path(output_path, module_name), np.ones((3, 2)))
+
+    monkeypatch.setattr(feature_extractors, "get_project_root", lambda: str(tmp_path))
+    monkeypatch.setattr(feature_extractors, "get_visual_embedding", get_visual_embedding)
+
+    module_names = ["features.3", "classifier.1"]
+    feature_extractors.extract_features("alexnet", use_cached=True, module_names=module_names)
+    assert calls == [module_names]
+    for module_name in module_names:
+        assert feature_extractors.is_complete(
+            feature_extractors.layer_feature_path(str(features_dir / "alexnet.npy"), module_name)
+        )
+
+    # with all layer stores complete, nothing is extracted again
+    feature_extractors.extract_features("alexnet", use_cached=True, module_names=module_names)
+    assert len(calls) == 1
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from naturalcogsci.feature_store import (
+    ChunkedFeatureWriter,
+    FeatureStore,
+    feature_name,
+    feature_path,
+    file_names_hash,
+    find_features,
+    is_complete,
+    open_features,
+    read_progress,
+    write_features,
+)
+
+
+def test_interrupted_rewrite_is_incomplete(tmp_path):
+    path = str(tmp_path / "store")
+    write_features(path, np.zeros((12, 3), dtype=np.float32), chunk_rows=4)
+    assert is_complete(path)
+
+    writer = ChunkedFeatureWriter(path, 12, 3, chunk_rows=4)
+    writer.write(0, np.full((4, 3), 2, dtype=np.float32))
+    # interrupted before `close`
+    del writer
+    assert not is_complete(path)
+    assert read_progress(path, "chunked")["completed"] == [[0, 4]]
+
+    writer = ChunkedFeatureWriter(path, 12, 3, chunk_rows=4, resume=True)
+    np.testing.assert_array_equal(writer.missing_rows(), np.arange(4, 12))
+    writer.write(4, np.full((8, 3), 2, dtype=np.float32))
+    writer.close()
+    np.testing.assert_array_equal(np.asarray(open_features(path)), 2)
+
+
+def test_row_order_hash_is_checked(tmp_path):
+    file_names_path = tmp_path / "file_names.txt"
+    file_names_path.write_text("/home/user/naturalcogsci/stimuli/a.jpg\n/home/user/naturalcogsci/stimuli/b.jpg\n")
+    path = str(tmp_path / "store")
+    write_features(path, np.eye(2, dtype=np.float32), row_order_hash=file_names_hash(str(file_names_path)))
+
+    store = FeatureStore(path)
+    assert store.row_order_hash == file_names_hash(str(file_names_path))
+    np.testing.assert_array_equal(store.gather(["stimuli/b.jpg"]), [[0, 1]])
+
+    file_names_path.write_text("/home/user/naturalcogsci/stimuli/b.jpg\n/home/user/naturalcogsci/stimuli/a.jpg\n")
+    with pytest.raises(ValueError):
+        FeatureStore(path)
+
+
+def test_find_features_in_both_formats(tmp_path):
+    np.save(tmp_path / "npy_model.npy", np.ones((8, 3)))
+    write_features(str(tmp_path / "chunked_model"), np.ones((8, 3), dtype=np.float32), chunk_rows=4)
+    # an interrupted store and other files are not features
+    ChunkedFeatureWriter(str(tmp_path / "partial_model"), 8, 3, chunk_rows=4)
+    (tmp_path / "file_names.txt").write_text("a.jpg\n")
+
+    paths = find_features(str(tmp_path))
+    assert [feature_name(path) for path in paths] == ["chunked_model", "npy_model"]
+    for name in ["chunked_model", "npy_model"]:
+        assert feature_path(str(tmp_path), name) in paths
+        np.testing.assert_array_equal(np.asarray(open_features(feature_path(str(tmp_path), name))), 1)
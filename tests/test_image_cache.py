@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from naturalcogsci.image_cache import CachedImageDataset, ImageCache, decode_params  # noqa: E402
+
+
+def _features(image):
+    # stands in for a model with its preprocessing, sensitive to every pixel
+    return np.asarray(image, dtype=np.float64).reshape(-1, 3) @ np.arange(1, 4)
+
+
+def test_cached_images_match_original_files(tmp_path):
+    rng = np.random.default_rng(0)
+    file_paths = []
+    for i, mode in enumerate(["RGB", "L", "RGBA"]):
+        channels = {"RGB": 3, "L": 1, "RGBA": 4}[mode]
+        pixels = rng.integers(0, 256, size=(24, 24, channels), dtype=np.uint8).squeeze()
+        path = str(tmp_path / f"image_{i}.png")
+        Image.fromarray(pixels, mode=mode).save(path)
+        file_paths.append(path)
+
+    cache = ImageCache.load(str(tmp_path / "cache"), file_paths, size=24)
+    dataset = CachedImageDataset(cache, transforms=_features)
+    for row, path in enumerate(file_paths):
+        # decoded like thingsvision's `ImageDataset`
+        np.testing.assert_array_equal(dataset[row], _features(Image.open(path).convert("RGB")))
+
+    assert cache.decode_params == decode_params(24)
+    # a cache of another size is not reused
+    assert ImageCache.load(str(tmp_path / "cache"), file_paths, size=12).decode_params == decode_params(12)
@@ -0,0 +1,96 @@
+import numpy as np
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+
+from naturalcogsci.learner_runs import REGULARISATION_COEFS, category_values, fit_regulariser
+from naturalcogsci.learners import CategoryLearner, regularisation_path
+
+
+def _baseline_learner(estimator, X, y):
+    # trial loop of `CategoryLearner` before the warm-started engine, standardising X in place
+    values = np.zeros((len(X), 2))
+    estimator.fit(np.zeros((2, X.shape[1])), np.array([0, 1]))
+    mean, std = 0, 1
+    for trial in range(len(X)):
+        values[trial] = estimator.predict_proba(((X[trial] - mean) / std).reshape(1, -1))
+        if 0 in y[: trial + 1] and 1 in y[: trial + 1]:
+            estimator = clone(estimator)
+            train_X = X[: trial + 1]
+            mean = train_X.mean(axis=0)
+            std = train_X.std(axis=0)
+            std = np.where(std == 0, 1, std)
+            train_X -= mean
+            train_X /= std
+            estimator.fit(train_X, y[: trial + 1])
+    return estimator, values
+
+
+def _baseline_fit_regulariser(penalty_type, X, y):
+    best_score = 0
+    best_alpha = 1
+    for alpha in REGULARISATION_COEFS:
+        estimator = LogisticRegression(penalty=penalty_type, C=alpha, max_iter=5000, solver="liblinear")
+        estimator, _ = _baseline_learner(estimator, X, y)
+        if estimator.score(X, y) > best_score:
+            best_score = estimator.score(X, y)
+            best_alpha = alpha
+    return best_alpha
+
+
+def _task(seed, n_trials=40, n_features=8):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_trials, n_features)) * rng.uniform(0.5, 5, n_features) + rng.normal(size=n_features)
+    y = (X @ rng.normal(size=n_features) + rng.normal(scale=2, size=n_trials) > 0).astype(int)
+    return X, y
+
+
+def test_fit_regulariser_matches_baseline():
+    for seed in range(3):
+        for penalty in ["l1", "l2"]:
+            X, y = _task(seed)
+            X_baseline = X.copy()
+            alpha, estimator = fit_regulariser(penalty, X, y)
+
+            assert alpha == _baseline_fit_regulariser(penalty, X_baseline, y)
+            # the observations are left standardised in the same way
+            np.testing.assert_array_equal(X, X_baseline)
+            assert estimator.C == alpha
+
+
+def test_regularisation_path_returns_best_fit():
+    X, y = _task(0)
+    scores, best_C, estimator = regularisation_path(X, y, REGULARISATION_COEFS)
+
+    std = X.std(axis=0)
+    X_standardised = (X - X.mean(axis=0)) / np.where(std == 0, 1, std)
+    assert best_C == REGULARISATION_COEFS[int(np.argmax(scores))]
+    assert estimator.C == best_C
+    assert estimator.score(X_standardised, y) == scores.max()
+
+
+def test_category_values_match_baseline():
+    for seed in range(3):
+        for penalty in ["l1", "l2"]:
+            X, y = _task(seed)
+            X_baseline = X.copy()
+            # liblinear draws its seed from the global random state
+            np.random.seed(seed)
+            alpha = _baseline_fit_regulariser(penalty, X_baseline, y)
+            estimator = LogisticRegression(penalty=penalty, C=alpha, max_iter=5000, solver="liblinear")
+            _, baseline_values = _baseline_learner(estimator, X_baseline, y)
+
+            np.random.seed(seed)
+            np.testing.assert_array_equal(category_values(X, y, regularisation=penalty), baseline_values)
+
+
+def test_newton_solver_with_default_estimator():
+    X, y = _task(1)
+    newton = CategoryLearner(solver="newton")
+    newton.fit(X.copy(), y)
+    sklearn = CategoryLearner(warm_start=True)
+    sklearn.fit(X.copy(), y)
+
+    # same objective, up to the tolerance of lbfgs
+    np.testing.assert_allclose(newton.values, sklearn.values, atol=1e-3)
+    scores, _, _ = regularisation_path(X, y, [0.1, 1], LogisticRegression())
+    assert scores.shape == (2,)
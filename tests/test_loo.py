@@ -0,0 +1,18 @@
+import numpy as np
+from scipy.special import expit
+
+from naturalcogsci.loo import approximate_loo, exact_loo
+
+
+def test_approximate_loo_is_close_to_exact():
+    for seed in range(3):
+        rng = np.random.default_rng(seed)
+        groups = np.repeat(np.arange(8), 30)
+        diff = rng.normal(size=len(groups))
+        slopes = rng.normal(1, 0.5, 8)
+        choice = (rng.uniform(size=len(groups)) < expit(slopes[groups] * diff)).astype(np.float64)
+
+        difference = np.abs(approximate_loo(diff, choice, groups) - exact_loo(diff, choice, groups))
+        # the tolerance stated in `approximate_loo`
+        assert difference.max() < 0.05
+        assert difference.mean() < 0.005
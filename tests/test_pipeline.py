@@ -0,0 +1,32 @@
+import os
+
+from naturalcogsci.pipeline import Pipeline, PipelineNode
+
+
+def _pipeline(tmp_path, n_nodes):
+    pipeline = Pipeline(str(tmp_path / "state"))
+    for i in range(n_nodes):
+        input_path = tmp_path / f"input_{i}.txt"
+        if not input_path.exists():
+            input_path.write_text(str(i))
+        output_path = tmp_path / f"output_{i}.txt"
+        pipeline.add(
+            PipelineNode(
+                f"node/{i}",
+                ["touch", str(output_path)],
+                inputs=[str(input_path)],
+                outputs=[str(output_path)],
+            )
+        )
+    return pipeline
+
+
+def test_parallel_run(tmp_path):
+    status = _pipeline(tmp_path, 40).run(n_jobs=8)
+    assert len(status) == 40 and set(status.values()) == {"done"}
+    assert all(os.path.exists(tmp_path / f"output_{i}.txt") for i in range(40))
+
+    # nothing is stale afterwards, until an input changes
+    assert _pipeline(tmp_path, 40).run(dry_run=True) == {}
+    (tmp_path / "input_3.txt").write_text("changed")
+    assert _pipeline(tmp_path, 40).run(dry_run=True) == {"node/3": "stale"}
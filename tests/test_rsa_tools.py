@@ -0,0 +1,31 @@
+import numpy as np
+
+from naturalcogsci.feature_store import write_features
+from naturalcogsci.rsa_tools import _centered_gram, cka, cka_matrix, hsic_unbiased
+
+
+def test_minibatch_cka_with_fewer_observations_than_batch_size():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(50, 10))
+    Y = X @ rng.normal(size=(10, 6)) + rng.normal(size=(50, 6))
+
+    # a single batch of all observations
+    K, L = _centered_gram(X), _centered_gram(Y)
+    expected = hsic_unbiased(K, L) / np.sqrt(hsic_unbiased(K, K) * hsic_unbiased(L, L))
+
+    np.testing.assert_allclose(cka(X, Y, method="minibatch"), expected)
+    np.testing.assert_allclose(cka(X, Y, method="minibatch", batch_size=200), expected)
+    np.testing.assert_allclose(cka(X, X, method="minibatch", batch_size=20), 1)
+
+
+def test_cka_matrix_matches_cka(tmp_path):
+    rng = np.random.default_rng(0)
+    # float32 features far from the origin, where centering in low precision would lose accuracy
+    features = [(rng.normal(size=(300, d)) + 10 * rng.normal(size=d)).astype(np.float32) for d in (5, 40, 12)]
+    np.save(tmp_path / "a.npy", features[0])
+    write_features(str(tmp_path / "b"), features[1], chunk_rows=64)
+
+    # blocks of single models and row chunks across the chunks of the store
+    matrix = cka_matrix([str(tmp_path / "a.npy"), str(tmp_path / "b"), features[2]], block_features=20, chunk_size=70)
+    expected = [[cka(X, Y, method="gram") for Y in features] for X in features]
+    np.testing.assert_allclose(matrix, expected, rtol=1e-12, atol=1e-12)
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+text_embeddings = pytest.importorskip("naturalcogsci.text_embeddings")
+
+
+def test_embed_texts_embeds_unique_texts_once():
+    calls = []
+
+    def function(batch):
+        calls.append(list(batch))
+        # the embedding of a text identifies it
+        return np.array([[len(text), ord(text[0])] for text in batch], dtype=np.float64)
+
+    texts = ["dog", "cat", "aardvark", "dog", "cat", "dog", "zebra"]
+    features = text_embeddings.embed_texts(texts, text_embeddings.FunctionBackend(function, batch_size=2))
+
+    embedded = [text for batch in calls for text in batch]
+    assert sorted(embedded) == sorted(set(texts))
+    assert all(len(batch) <= 2 for batch in calls)
+    np.testing.assert_array_equal(features, function(texts))